@@ -0,0 +1,354 @@
+"""
+Benchmarks of the simulation and rendering hot paths.
+
+Run from the repository folder:
+    python benchmarks/benchmark.py --save benchmarks/results.json
+    python benchmarks/benchmark.py --baseline benchmarks/results.json --tolerance 0.25
+    python benchmarks/benchmark.py --budgets
+
+Each benchmark reports the median time of one operation, in milliseconds.
+With --baseline, the command fails when a benchmark is slower than the baseline by more than the tolerance.
+The command also fails when the memory used by an entity exceeds its budget.
+With --budgets, only the memory budgets are checked.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER','dummy')
+os.environ.setdefault('SDL_AUDIODRIVER','dummy')
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+
+import pygame
+from pygame.math import Vector2
+from model import GameState, Unit, TileLayer
+from controller import GameController, LoadLevelCommand, MoveBulletsCommand
+from view import ArrayLayer, UnitsLayer, BulletsLayer, ExplosionsLayer
+
+
+benchmarks = {}
+
+def benchmark(name):
+    """
+    Register a benchmark: a function returning (setup, operation).
+    setup() is called before each repetition, and its result is given to operation()
+    """
+    def register(function):
+        benchmarks[name] = function
+        return function
+    return register
+
+
+def writeLevel(fileName,width,height,unitCount,wallRatio=0.05,seed=0):
+    """
+    Write a random json level: the tank is the first unit, walls and units never overlap
+    """
+    rng = random.Random(seed)
+    cells = [ (x,y) for y in range(height) for x in range(width) ]
+    rng.shuffle(cells)
+    unitCells = cells[:unitCount]
+    wallCells = set(cells[unitCount:unitCount+int(wallRatio * width * height)])
+    data = {
+        'name': os.path.basename(fileName),
+        'width': width,
+        'height': height,
+        'CellSize': [64,64],
+        'ground': [ [ [5,1] for x in range(width) ] for y in range(height) ],
+        'walls': [ [ [1,1] if (x,y) in wallCells else None for x in range(width) ] for y in range(height) ],
+        'units': [ { 'position': list(cell), 'direction': [1,0] if index == 0 else [0,2] } for index,cell in enumerate(unitCells) ]
+    }
+    with open(fileName,'w') as file:
+        json.dump(data,file)
+
+
+class Scenario():
+    """
+    A level with units and bullets, loaded in a new game state
+    """
+    # Temporary folder of the generated levels, created by the main program
+    folder = None
+
+    def __init__(self,width,height,unitCount,bulletCount,seed=0):
+        fileName = os.path.join(self.folder,'level-{}x{}-{}.json'.format(width,height,unitCount))
+        if not os.path.exists(fileName):
+            writeLevel(fileName,width,height,unitCount,seed=seed)
+        GameState.resetInstance()
+        self.controller = GameController()
+        self.state = self.controller.gameState
+        self.controller.commands.append(LoadLevelCommand(self.state,fileName))
+        self.controller.update()
+
+        # Bullets fired by random units, with a range large enough to stay alive during the benchmark
+        rng = random.Random(seed)
+        units = self.state.level.units
+        for index in range(bulletCount):
+            unit = units[rng.randrange(len(units))]
+            self.state.setWeaponTarget(unit,Vector2(rng.uniform(0,width-1),rng.uniform(0,height-1)))
+            self.state.bullets.add(unit,width + height)
+
+    def tick(self):
+        state = self.state
+        tank = state.level.units[0]
+        self.controller.processPlayerInput(Vector2(),Vector2(tank.position),False)
+        self.controller.update()
+
+
+@benchmark('update_64x64_100units_0bullets')
+def updateNoBullets():
+    return lambda: Scenario(64,64,100,0), lambda scenario: scenario.tick()
+
+@benchmark('update_64x64_100units_10bullets')
+def updateFewBullets():
+    return lambda: Scenario(64,64,100,10), lambda scenario: scenario.tick()
+
+@benchmark('update_64x64_100units_1000bullets')
+def updateBullets():
+    return lambda: Scenario(64,64,100,1000), lambda scenario: scenario.tick()
+
+@benchmark('update_64x64_500units_5000bullets')
+def updateManyBullets():
+    return lambda: Scenario(64,64,500,5000), lambda scenario: scenario.tick()
+
+@benchmark('update_256x256_5000units_0bullets')
+def updateManyUnits():
+    return lambda: Scenario(256,256,5000,0), lambda scenario: scenario.tick()
+
+@benchmark('move_bullets_64x64_500units_5000bullets')
+def moveBullets():
+    def operation(scenario):
+        MoveBulletsCommand(scenario.state).run()
+    return lambda: Scenario(64,64,500,5000), operation
+
+@benchmark('snapshot_64x64_500units_5000bullets')
+def snapshot():
+    return lambda: Scenario(64,64,500,5000).state, lambda state: state.snapshot()
+
+@benchmark('restore_64x64_500units_5000bullets')
+def restore():
+    def setup():
+        state = Scenario(64,64,500,5000).state
+        return state,state.snapshot()
+    return setup, lambda context: context[0].restore(context[1])
+
+def loadBenchmark(size,cached):
+    fileName = os.path.join(Scenario.folder,'load-{}.json'.format(size))
+    writeLevel(fileName,size,size,size)
+    GameState.resetInstance()
+    controller = GameController()
+    def setup():
+        if not cached:
+            # Any change of the json file invalidates the compiled cache
+            with open(fileName,'a') as file:
+                file.write(' ')
+        return controller.gameState
+    def operation(state):
+        LoadLevelCommand(state,fileName).run()
+    if cached:
+        operation(setup())
+    return setup, operation
+
+@benchmark('load_json_16x16')
+def loadSmall():
+    return loadBenchmark(16,False)
+
+@benchmark('load_json_256x256')
+def loadLarge():
+    return loadBenchmark(256,False)
+
+@benchmark('load_cached_16x16')
+def loadSmallCached():
+    return loadBenchmark(16,True)
+
+@benchmark('load_cached_256x256')
+def loadLargeCached():
+    return loadBenchmark(256,True)
+
+def renderBenchmark(createLayer,bulletCount=0,unitCount=100):
+    surface = pygame.display.get_surface()
+    def setup():
+        scenario = Scenario(20,11,unitCount,bulletCount)
+        scenario.state.camera.setViewport(*surface.get_size())
+        return createLayer(scenario.state)
+    def operation(layer):
+        layer.render(surface)
+    return setup, operation
+
+@benchmark('render_ground')
+def renderGround():
+    # The first render bakes the layer, the next ones only blit it
+    return renderBenchmark(lambda state: ArrayLayer(state.level.cellSize,"assets/ground.png",state,state.level.ground,0))
+
+@benchmark('render_ground_1000x1000_scrolling')
+def renderGroundScrolling():
+    # The camera moves one cell per render over a large world, baking chunks as they become visible
+    surface = pygame.display.get_surface()
+    def setup():
+        GameState.resetInstance()
+        state = GameState.getInstance()
+        state.worldSize = Vector2(1000,1000)
+        state.level.ground = TileLayer.filled(1000,1000,Vector2(5,1))
+        state.camera.setViewport(*surface.get_size())
+        return ArrayLayer(state.level.cellSize,"assets/ground.png",state,state.level.ground,0)
+    def operation(layer):
+        camera = layer.gameState.camera
+        camera.x += layer.cellWidth
+        camera.y += layer.cellHeight
+        layer.render(surface)
+    return setup, operation
+
+@benchmark('render_walls_bake')
+def renderWallsBake():
+    def createLayer(state):
+        layer = ArrayLayer(state.level.cellSize,"assets/walls.png",state,state.level.walls)
+        layer.levelLoaded()
+        return layer
+    setup, operation = renderBenchmark(createLayer)
+    return setup, lambda layer: (layer.levelLoaded(), operation(layer))
+
+@benchmark('render_units_100')
+def renderUnits():
+    return renderBenchmark(lambda state: UnitsLayer(state.level.cellSize,"assets/units.png",state,state.level.units))
+
+@benchmark('render_bullets_1000')
+def renderBullets():
+    return renderBenchmark(lambda state: BulletsLayer(state.level.cellSize,"assets/explosions.png",state,state.bullets),1000)
+
+@benchmark('render_explosions_100')
+def renderExplosions():
+    def createLayer(state):
+        layer = ExplosionsLayer(state.level.cellSize,"assets/explosions.png",state)
+        for unit in state.level.units:
+            layer.add(unit.position)
+        return layer
+    return renderBenchmark(createLayer)
+
+@benchmark('render_explosions_1000_ticking')
+def renderManyExplosions():
+    # Explosions started over several epochs, the animation advancing one epoch per render
+    def createLayer(state):
+        layer = ExplosionsLayer(state.level.cellSize,"assets/explosions.png",state,1000)
+        rng = random.Random(0)
+        for index in range(1000):
+            state.epoch = index // 100
+            layer.add(Vector2(rng.randrange(state.worldWidth),rng.randrange(state.worldHeight)))
+        return layer
+    setup, operation = renderBenchmark(createLayer)
+    def tick(layer):
+        layer.gameState.epoch += 1
+        operation(layer)
+    return setup, tick
+
+
+# Maximum number of bytes per entity, including the objects it owns.
+# A unit is kept 5% under the 248 B of the Unit with a __dict__ (216.5 B with __slots__)
+memoryBudgets = {
+    'unit_bytes': 236,
+}
+
+def unitBytes():
+    """
+    Returns the memory used by a unit as loaded from a level (its tile is shared)
+    """
+    tile = Vector2(0,2)
+    tracemalloc.start()
+    startMemory = tracemalloc.get_traced_memory()[0]
+    units = [ Unit(Vector2(index % 64,index // 64),tile) for index in range(10000) ]
+    memory = tracemalloc.get_traced_memory()[0] - startMemory
+    tracemalloc.stop()
+    return memory / len(units)
+
+def checkBudgets():
+    """
+    Print the memory used per entity, and returns the names of the exceeded budgets
+    """
+    exceeded = []
+    for name,measure in [ ('unit_bytes',unitBytes) ]:
+        value = measure()
+        status = "ok"
+        if value > memoryBudgets[name]:
+            status = "OVER BUDGET"
+            exceeded.append(name)
+        print("{:45s} {:10.1f} B   budget {} B  {}".format(name,value,memoryBudgets[name],status))
+    return exceeded
+
+
+def measure(function,repeat,number):
+    """
+    Returns the median time of one operation in milliseconds
+    """
+    setup, operation = function()
+    samples = []
+    for index in range(repeat):
+        context = setup()
+        startTime = time.perf_counter()
+        for count in range(number):
+            operation(context)
+        samples.append((time.perf_counter() - startTime) * 1000 / number)
+    return statistics.median(samples)
+
+
+def compare(results,baseline,tolerance):
+    """
+    Print the comparison with the baseline, and returns the names of the regressed benchmarks
+    """
+    regressions = []
+    for name,value in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print("{:45s} {:10.4f} ms  (no baseline)".format(name,value))
+            continue
+        ratio = value / reference if reference > 0 else 1.0
+        status = "ok"
+        if ratio > 1 + tolerance:
+            status = "REGRESSION"
+            regressions.append(name)
+        print("{:45s} {:10.4f} ms  {:+7.1%}  {}".format(name,value,ratio - 1,status))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks of the simulation and rendering hot paths")
+    parser.add_argument('names', nargs='*', help="benchmarks to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=5, help="number of repetitions, the median is kept")
+    parser.add_argument('--number', type=int, default=20, help="number of operations per repetition")
+    parser.add_argument('--save', help="json file where the results are saved")
+    parser.add_argument('--baseline', help="json file of results to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown before a regression, e.g. 0.25 for 25%%")
+    parser.add_argument('--budgets', action='store_true', help="only check the memory budgets")
+    args = parser.parse_args()
+
+    if args.budgets:
+        sys.exit(1 if len(checkBudgets()) > 0 else 0)
+
+    pygame.init()
+    pygame.display.set_mode((1280,720))
+
+    names = args.names or list(benchmarks)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='towerdefense-benchmark-') as folder:
+        Scenario.folder = folder
+        for name in names:
+            results[name] = measure(benchmarks[name],args.repeat,args.number)
+            if args.baseline is None:
+                print("{:45s} {:10.4f} ms".format(name,results[name]))
+
+    if args.save is not None:
+        with open(args.save,'w') as file:
+            json.dump({ 'unit': 'ms', 'results': results },file,indent=2)
+
+    failures = checkBudgets()
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results,baseline,args.tolerance)
+        if len(regressions) > 0:
+            print("{} regression(s): {}".format(len(regressions),", ".join(regressions)))
+        failures += regressions
+    if len(failures) > 0:
+        sys.exit(1)
@@ -0,0 +1,17 @@
+import argparse
+import glob
+import time
+from controller.level_file import CompiledLevel, compileLevel
+
+
+parser = argparse.ArgumentParser(description="Compile json levels to the binary level format")
+parser.add_argument('levels', nargs='*', help="level files (default: levels/*.json)")
+args = parser.parse_args()
+
+for fileName in args.levels or sorted(glob.glob("levels/*.json")):
+    startTime = time.perf_counter()
+    level = compileLevel(fileName)
+    elapsed = time.perf_counter() - startTime
+    print("{} -> {} ({}x{}, {} units, {:.1f} ms)".format(
+        fileName,CompiledLevel.cacheFileName(fileName),level.width,level.height,len(level.units),1000 * elapsed
+    ))
@@ -1,3 +1,8 @@
 
-from .command import Command, MoveCommand, TargetCommand, ShootCommand, MoveBulletCommand, DeleteDestroyedCommand
-from .game_controller import GameController
\ No newline at end of file
+from .command import Command, MoveCommand, TargetCommand, ShootCommand, MoveBulletsCommand, LoadLevelCommand
+from .command_queue import CommandQueue
+from .game_controller import GameController
+from .player import Player, RandomPlayer, ScriptedPlayer
+from .headless import HeadlessRunner
+from .profiler import Profiler
+from .replay import ReplayRecorder, ReplayFile, ReplayPlayer
@@ -1,17 +1,40 @@
 from pygame.math import Vector2
-from model import Unit,Bullet,Level
-import json
+from model import Unit,Level,LevelLoadedEvent,BulletFiredEvent
+from .level_file import CompiledLevel, compileLevel
 import os
 
 class Command():
+    """
+    Commands are created once and then reused by a CommandQueue: the constructor arguments
+    are given to set(), which is called again each time the command is reused.
+    In a tick, the commands run by increasing priority, whatever the order they were queued in:
+    the level loading, the moves of the units, their targets, their shots, then the bullets.
+    """
+    priority = 0
+
+    def __init__(self,*args):
+        self.set(*args)
+
+    def set(self,*args):
+        raise NotImplementedError()
+
     def run(self):
         raise NotImplementedError()
+
+    @classmethod
+    def runBatch(cls,commands,count):
+        """
+        Run the first count commands of the list, which all have this type
+        """
+        for index in range(count):
+            commands[index].run()
         
 class MoveCommand(Command):
     """
     This command moves a unit in a given direction
     """
-    def __init__(self,state,unit,moveVector):
+    priority = 1
+    def set(self,state,unit,moveVector):
         self.state = state
         self.unit = unit
         self.moveVector = moveVector
@@ -40,7 +63,7 @@ class MoveCommand(Command):
             return
 
         # Don't allow wall positions
-        if not self.state.level.walls[int(newPos.y)][int(newPos.x)] is None:
+        if not self.state.level.isPassable(int(newPos.x),int(newPos.y)):
             return
 
         # Don't allow other unit positions 
@@ -48,18 +71,20 @@ class MoveCommand(Command):
         if not unitIndex is None:
                 return
 
-        unit.position = newPos
+        self.state.moveUnit(unit,newPos)
         
 class TargetCommand(Command):
-    def __init__(self,state,unit,target):
+    priority = 2
+    def set(self,state,unit,target):
         self.state = state
         self.unit = unit
         self.target = target
     def run(self):
-        self.unit.weaponTarget = self.target
+        self.state.setWeaponTarget(self.unit,self.target)
         
 class ShootCommand(Command):
-    def __init__(self,state,unit):
+    priority = 3
+    def set(self,state,unit):
         self.state = state
         self.unit = unit
     def run(self):
@@ -67,79 +92,60 @@ class ShootCommand(Command):
             return
         if self.state.epoch-self.unit.lastBulletEpoch < self.state.bulletDelay:
             return
-        self.unit.lastBulletEpoch = self.state.epoch
-        self.state.bullets.append(Bullet(self.unit))
-        
-class MoveBulletCommand(Command):
-    def __init__(self,state,bullet):
+        self.state.unitFired(self.unit)
+        self.state.bullets.add(self.unit,self.state.bulletRange)
+        self.state.events.publish(BulletFiredEvent(self.unit))
+    @classmethod
+    def runBatch(cls,commands,count):
+        if count == 0:
+            return
+        state = commands[0].state
+        epoch = state.epoch
+        lastEpoch = epoch - state.bulletDelay
+        bullets = state.bullets
+        bulletRange = state.bulletRange
+        events = state.events
+        publish = events.isSubscribed(BulletFiredEvent)
+        unitFired = state.unitFired
+        for index in range(count):
+            unit = commands[index].unit
+            if unit.status != "alive" or unit.lastBulletEpoch > lastEpoch:
+                continue
+            unitFired(unit)
+            bullets.add(unit,bulletRange)
+            if publish:
+                events.publish(BulletFiredEvent(unit))
+        
+class MoveBulletsCommand(Command):
+    """
+    This command moves all the bullets in one batched step (see BulletStore.step)
+    """
+    priority = 4
+    def set(self,state):
         self.state = state
-        self.bullet = bullet
     def run(self):
-        direction = (self.bullet.endPosition - self.bullet.startPosition).normalize()
-        newPos = self.bullet.position + self.state.bulletSpeed * direction
-        newCenterPos = newPos + Vector2(0.5,0.5)
-        # If the bullet goes outside the world, destroy it
-        if not self.state.isInside(newPos):
-            self.bullet.status = "destroyed"
-            return
-        # If the bullet goes towards the target cell, destroy it
-        if ((direction.x >= 0 and newPos.x >= self.bullet.endPosition.x) \
-        or (direction.x < 0 and newPos.x <= self.bullet.endPosition.x)) \
-        and ((direction.y >= 0 and newPos.y >= self.bullet.endPosition.y) \
-        or (direction.y < 0 and newPos.y <= self.bullet.endPosition.y)):
-            self.bullet.status = "destroyed"
-            return
-        # If the bullet is outside the allowed range, destroy it
-        if newPos.distance_to(self.bullet.startPosition) >= self.state.bulletRange:  
-            self.bullet.status = "destroyed"
-            return
-        # If the bullet hits a unit, destroy the bullet and the unit 
-        unit = self.state.findLiveUnit(newCenterPos)
-        if not unit is None and unit != self.bullet.unit:
-            self.bullet.status = "destroyed"
-            unit.status = "destroyed"
-            self.state.notifyUnitDestroyed(unit)
-            return
-        # Nothing happends, continue bullet trajectory
-        self.bullet.position = newPos
+        self.state.bullets.step(self.state)
         
-class DeleteDestroyedCommand(Command)       :
-    def __init__(self,itemList):
-        self.itemList = itemList
-    def run(self):
-        newList = [ item for item in self.itemList if item.status == "alive" ]
-        self.itemList[:] = newList
-
-
 class LoadLevelCommand(Command)       :
-    def __init__(self,state,fileName):
+    def set(self,state,fileName,level=None):
+        """
+        level is the CompiledLevel of fileName if it is already loaded, otherwise it is loaded by run
+        """
         self.state = state
         self.fileName = fileName
+        self.level = level
         
-    def decodeArrayLayer(self,arrayLayer):
-        """
-        Create an array from a array layer json object
-        """        
-        array = []
-        
-        for y in range(len(arrayLayer)):
-            row = arrayLayer[y]
-            temp = []
-            for x in range(len(row)):
-                cell= row[x]
-                if cell is None:
-                    temp.append(None)
-                else:
-                    temp.append(Vector2(cell[0],cell[1]))
-            array.append(temp)
-        return array
-    
     def decodeUnitsLayer(self,state,unitLayer):
         array = []
-        for unit in unitLayer:
-            position = Vector2(unit['position'][0],unit['position'][1])
-            direction = Vector2(unit['direction'][0],unit['direction'][1])
-            array.append(Unit(position,direction))
+        tiles = {}
+        for positionX,positionY,tileX,tileY,flags in unitLayer:
+            tile = tiles.get((tileX,tileY))
+            if tile is None:
+                tile = Vector2(tileX,tileY)
+                tiles[(tileX,tileY)] = tile
+            unit = Unit(Vector2(positionX,positionY),tile)
+            unit.mobile = bool(flags & CompiledLevel.mobileFlag)
+            array.append(unit)
         return array
 
         
@@ -149,34 +155,35 @@ class LoadLevelCommand(Command)       :
         if not os.path.exists(self.fileName):
             raise RuntimeError("No file {}".format(self.fileName))
 
-
-        with open(self.fileName, 'r') as json_file:
-            data = json.load(json_file)
-        
+        # The compiled cache is used when it matches the json file
+        data = self.level if self.level is not None else compileLevel(self.fileName)
         
         state = self.state
-        state.worldSize = Vector2(data['width'],data['height']) # level 1 World size: [16, 10] level2 World size: [19, 11]
+        state.worldSize = Vector2(data.width,data.height) # level 1 World size: [16, 10] level2 World size: [19, 11]
 
         # Create level
         level=state.level
-        # Ground layer
-        level.ground[:] = self.decodeArrayLayer(data['ground'])
-        cellSize = Vector2( data['CellSize'][0],data['CellSize'][1]) #Cell size: [64, 64]
+        # Ground layer, the tiles stay in the compiled file until they are read
+        level.ground.setTiles(data.ground)
+        cellSize = Vector2(data.cellSize[0],data.cellSize[1]) #Cell size: [64, 64]
         level.cellSize = cellSize
         
 
         # Walls layer
-        level.walls[:] = self.decodeArrayLayer(data['walls'])
+        level.setWalls(data.walls)
         
 
         # Units layer
-        level.units[:] = self.decodeUnitsLayer(state,data['units'])
+        level.units[:] = self.decodeUnitsLayer(state,data.units)
+        state.unitsChanged()
 
         level.gameOver = False
         
         
         # Explosions layers
         state.bullets.clear()
+
+        state.events.publish(LevelLoadedEvent())
         
         
         
\ No newline at end of file
@@ -0,0 +1,74 @@
+class CommandQueue():
+    """
+    Commands of a tick, grouped by type. Each type keeps a pool of command instances,
+    reused from one tick to the next, and its batch is run with one runBatch() call.
+    Batches are run by increasing priority of their type (see Command), types with the same
+    priority in the order they were first queued in the tick.
+    """
+    def __init__(self):
+        # Command type -> pooled instances, the first counts[type] ones are queued
+        self.pools = {}
+        self.counts = {}
+        self.order = []
+
+    def __len__(self):
+        return sum(self.counts[commandType] for commandType in self.order)
+
+    def push(self,commandType,*args):
+        """
+        Queue a command of a given type, reusing a pooled instance if possible
+        """
+        count = self.counts.get(commandType,0)
+        if count == 0:
+            self.addType(commandType)
+            pool = self.pools.get(commandType)
+            if pool is None:
+                pool = []
+                self.pools[commandType] = pool
+        else:
+            pool = self.pools[commandType]
+        if count < len(pool):
+            pool[count].set(*args)
+        else:
+            pool.append(commandType(*args))
+        self.counts[commandType] = count + 1
+
+    def append(self,command):
+        """
+        Queue a command that was already created. It then joins the pool of its type.
+        """
+        commandType = type(command)
+        count = self.counts.get(commandType,0)
+        if count == 0:
+            self.addType(commandType)
+        pool = self.pools.setdefault(commandType,[])
+        if count < len(pool):
+            pool[count] = command
+        else:
+            pool.append(command)
+        self.counts[commandType] = count + 1
+
+    def addType(self,commandType):
+        """
+        Add a type to the running order, after the types of lower or equal priority
+        """
+        order = self.order
+        index = len(order)
+        while index > 0 and order[index-1].priority > commandType.priority:
+            index -= 1
+        order.insert(index,commandType)
+
+    def batches(self):
+        """
+        Returns the queued (type, commands, count) batches, in running order
+        """
+        return [ (commandType,self.pools[commandType],self.counts[commandType]) for commandType in self.order ]
+
+    def run(self):
+        for commandType in self.order:
+            commandType.runBatch(self.pools[commandType],self.counts[commandType])
+
+    def clear(self):
+        for commandType in self.order:
+            self.counts[commandType] = 0
+        self.order.clear()
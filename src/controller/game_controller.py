@@ -1,33 +1,43 @@
 from model import GameState 
 import pygame
+import os
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pygame.math import Vector2
-from .command import MoveCommand,TargetCommand,ShootCommand,MoveBulletCommand,DeleteDestroyedCommand,LoadLevelCommand
+from .command import MoveCommand,TargetCommand,ShootCommand,MoveBulletsCommand,LoadLevelCommand
+from .command_queue import CommandQueue
+from .level_file import compileLevel, fileSignature
+from .replay import ReplayRecorder
 class GameController():
-    
+    levelFileNames = [ "levels/level1.json", "levels/level2.json", "levels/level3.json" ]
+
     def __init__(self):
         self.gameState = GameState.getInstance()
-        self.gameState.menu.menuItems = [
-            {
-                'title': 'Level 1',
-                'action': lambda: self.loadLevelRequested("levels/level1.json")
-            },
-            {
-                'title': 'Level 2',
-                'action': lambda: self.loadLevelRequested("levels/level2.json")
-            },
-            {
-                'title': 'Level 3',
-                'action': lambda: self.loadLevelRequested("levels/level3.json")
-            },
-            {
-                'title': 'Quit',
-                'action': lambda: self.quitRequested()
-            }
-        ]  
+        self.resetMenu()
 
         
         # Controls
-        self.commands = []
+        self.commands = CommandQueue()
+
+        # Optional Profiler, timing each command type
+        self.profiler = None
+
+        # Optional Player replacing the keyboard and the mouse in the levels
+        self.player = None
+
+        # Replay recording: each loaded level is recorded in a new file
+        self.recordFileName = None
+        self.recorder = None
+        self.recordCount = 0
+
+        # Background compilation of the levels (see preloadLevels)
+        self.levelExecutor = None
+        self.levelPreloads = {}
+        self.levelLoadTimes = {}
+
+        # Optional function waiting for the assets the levels need, called before the Play mode (see UserInterface)
+        self.assetsBarrier = None
     
 
     def gameWon(self):
@@ -39,19 +49,53 @@ class GameController():
 
     def loadLevelRequested(self, fileName):
         state = self.gameState
-        self.commands.append(LoadLevelCommand(state,fileName))
+        # Wait for the level if it is being compiled in the background,
+        # and use it if the file didn't change since it was read
+        level = None
+        preload = self.levelPreloads.pop(fileName,None)
+        if preload is not None:
+            signature,compiled = preload.result()
+            if compiled is not None and signature == fileSignature(fileName):
+                level = compiled
+        self.waitAssets()
+        self.commands.append(LoadLevelCommand(state,fileName,level))
         try:
             self.update()
             state.currentActiveMode = 'Play'
         except Exception as ex:
             print(ex)
             self.showMessage("Level loading failed :-(")
+            return
+        if self.recordFileName is not None:
+            self.startRecording(fileName)
+
+    def startRecording(self,levelFileName):
+        """
+        Record the inputs of the level in recordFileName, or recordFileName-<n> after the first level
+        """
+        self.stopRecording()
+        fileName = self.recordFileName
+        if self.recordCount > 0:
+            base,extension = os.path.splitext(fileName)
+            fileName = "{}-{}{}".format(base,self.recordCount,extension)
+        self.recordCount += 1
+        self.recorder = ReplayRecorder(fileName,self.gameState,levelFileName)
+
+    def stopRecording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
 
     def worldSizeChanged(self, worldSize):
         self.window = pygame.display.set_mode((int(worldSize.x),int(worldSize.y)))
         
+    def waitAssets(self):
+        if self.assetsBarrier is not None:
+            self.assetsBarrier()
+
     def showGameRequested(self):
         state = self.gameState
+        self.waitAssets()
         state.currentActiveMode = 'Play'
 
     def showMenuRequested(self):
@@ -69,26 +113,53 @@ class GameController():
     def resetMenu(self):
         self.gameState.menu.menuItems = [
             {
-                'title': 'Level 1',
-                'action': lambda: self.loadLevelRequested("levels/level1.json")
-            },
-            {
-                'title': 'Level 2',
-                'action': lambda: self.loadLevelRequested("levels/level2.json")
-            },
-            {
-                'title': 'Level 3',
-                'action': lambda: self.loadLevelRequested("levels/level3.json")
-            },
+                'title': 'Level {}'.format(index + 1),
+                'action': lambda fileName=fileName: self.loadLevelRequested(fileName)
+            }
+            for index,fileName in enumerate(self.levelFileNames)
+        ] + [
             {
                 'title': 'Quit',
                 'action': lambda: self.quitRequested()
             }
-        ]  
+        ]
+
+    def preloadLevels(self):
+        """
+        Compile the levels of the menu on a background thread (see compileLevel),
+        so loading them only reads the compiled files
+        """
+        if self.levelExecutor is None:
+            self.levelExecutor = ThreadPoolExecutor(max_workers=1,thread_name_prefix='levels')
+        for fileName in self.levelFileNames:
+            if fileName not in self.levelPreloads:
+                self.levelPreloads[fileName] = self.levelExecutor.submit(self.preloadLevel,fileName)
 
-    def processInputMenu(self):
+    def preloadLevel(self,fileName):
+        """
+        Returns the signature of the file (see fileSignature) and its compiled level, None if it can't be compiled
+        """
+        startTime = time.perf_counter()
+        signature = fileSignature(fileName)
+        try:
+            level = compileLevel(fileName)
+        except Exception:
+            # The error is reported when the level is loaded
+            level = None
+        self.levelLoadTimes[fileName] = time.perf_counter() - startTime
+        return signature,level
+
+    def levelsReady(self):
+        return all(future.done() for future in self.levelPreloads.values())
+
+    def processInputMenu(self,events=None):
+        """
+        Process the pygame events, or the given ones
+        """
+        if events is None:
+            events = pygame.event.get()
         menu=self.gameState.menu
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 self.quitRequested()
                 break
@@ -108,8 +179,13 @@ class GameController():
                     except Exception as ex:
                         print(ex)
 
-    def processInputMessage(self):
-        for event in pygame.event.get():
+    def processInputMessage(self,events=None):
+        """
+        Process the pygame events, or the given ones
+        """
+        if events is None:
+            events = pygame.event.get()
+        for event in events:
             if event.type == pygame.QUIT:
                 self.quitRequested()
                 break
@@ -125,7 +201,6 @@ class GameController():
         state = self.gameState
         moveVector = Vector2()
         mouseClicked = False
-        tank = self.gameState.level.units[0]
         for event in pygame.event.get():
             if event.type == pygame.KEYDOWN:
                 if event.type == pygame.QUIT:
@@ -134,6 +209,9 @@ class GameController():
                 elif event.key == pygame.K_ESCAPE:
                     self.showMenuRequested()
                     break
+                elif event.key == pygame.K_F3:
+                    if self.profiler is not None:
+                        self.profiler.toggleOverlay()
                 elif event.key == pygame.K_RIGHT:
                     moveVector.x = 1
                 elif event.key == pygame.K_LEFT:
@@ -145,75 +223,111 @@ class GameController():
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 mouseClicked = True
 
+        # A player replaces the keyboard and the mouse
+        if self.player is not None:
+            if state.currentActiveMode == 'Play':
+                moveVector,targetCell,shoot = self.player.nextInput(state)
+                self.processPlayerInput(moveVector,targetCell,shoot)
+            return
+
+        # Mouse controls the target of the player's unit, the window shows the world from the camera
+        targetCell = state.camera.screenToCell(state,pygame.mouse.get_pos()) - Vector2(0.5,0.5)
+
+        self.processPlayerInput(moveVector,targetCell,mouseClicked)
+
+    def processPlayerInput(self,moveVector,targetCell,shoot):
+        """
+        Create the commands of a level tick from the player's input.
+        The input can come from pygame (see processInputLevel) or from a Player.
+        """
+        state = self.gameState
+        tank = state.level.units[0]
+
+        if self.recorder is not None:
+            self.recorder.record(state,moveVector,targetCell,shoot)
+
         # If the game is over, all commands creations are disabled
         if state.level.gameOver:
             return
                     
         # Keyboard controls the moves of the player's unit
+        commands = self.commands
         if moveVector.x != 0 or moveVector.y != 0:
-            self.commands.append(
-                MoveCommand(state,tank,moveVector)
-            )
+            commands.push(MoveCommand,state,tank,moveVector)
                     
         # Mouse controls the target of the player's unit
-        mousePos = pygame.mouse.get_pos()                    
-        targetCell = Vector2()
-        targetCell.x = mousePos[0] / state.level.cellWidth - 0.5
-        targetCell.y = mousePos[1] / state.level.cellHeight - 0.5
-        command = TargetCommand(state,tank,targetCell)
-        self.commands.append(command)
+        commands.push(TargetCommand,state,tank,targetCell)
 
         # Shoot if left mouse was clicked
-        if mouseClicked:
-            self.commands.append(
-                ShootCommand(state,tank)
-            )
+        if shoot:
+            commands.push(ShootCommand,state,tank)
                 
-        # Other units always target the player's unit and shoot if close enough
-        for unit in state.level.units:
-            if unit != tank:
-                self.commands.append(
-                    TargetCommand(state,unit,tank.position)
-                )
-                if unit.position.distance_to(tank.position) <= state.bulletRange:
-                    self.commands.append(
-                        ShootCommand(state,unit)
-                    )
+        # Mobile units move towards the player's unit, every unitMoveDelay epochs
+        if state.epoch % state.unitMoveDelay == 0:
+            flowField = None
+            for unit in state.level.units:
+                if not unit.mobile or unit == tank or unit.status != "alive":
+                    continue
+                if flowField is None:
+                    flowField = state.flowField
+                    flowField.update(state,tank.position)
+                move = flowField.nextMove(state,unit.position)
+                if move is not None:
+                    commands.push(MoveCommand,state,unit,move)
+
+        # Other units always target the player's unit and shoot if close enough, reloaded, and not behind a wall.
+        # They are selected on the unit grid and arrays, and only the commands that change something are queued.
+        units = state.level.units
+        arrays = state.unitArrays
+        retarget = arrays.notTargeting(tank.position)
+        retarget[tank.index] = False
+        for index in np.flatnonzero(retarget).tolist():
+            commands.push(TargetCommand,state,units[index],tank.position)
+        # The live units in range are found in the cells around the tank, in the order of level.units
+        ready = arrays.readyToShoot(state.epoch,state.bulletDelay)
+        shooters = sorted(unit.index for unit in state.findUnitsInRange(tank.position,state.bulletRange)
+                          if unit is not tank and ready[unit.index])
+        lineOfSight = state.lineOfSight
+        for index in shooters:
+            unit = units[index]
+            if lineOfSight.isClear(state,unit.position,tank.position):
+                commands.push(ShootCommand,state,unit)
                 
-        # Bullets automatic movement
-        for bullet in state.bullets:
-            self.commands.append(
-                MoveBulletCommand(state,bullet)
-            )
-            
-        # Delete any destroyed bullet
-        self.commands.append(
-            DeleteDestroyedCommand(state.bullets)
-        )
+        # Bullets automatic movement, destroyed bullets are deleted
+        commands.push(MoveBulletsCommand,state)
                     
+    def runProfiledCommands(self):
+        """
+        Run the commands, and add the time of each command batch to the profiler
+        """
+        for commandType,commands,count in self.commands.batches():
+            startTime = time.perf_counter()
+            commandType.runBatch(commands,count)
+            self.profiler.add("command." + commandType.__name__,time.perf_counter() - startTime)
+
     def update(self):
         state = self.gameState
-        tank = self.gameState.level.units[0]
-        for command in self.commands:
-            command.run()
+        # Only the moves of the last tick are interpolated
+        state.previousPositions.clear()
+        if self.profiler is None:
+            self.commands.run()
+        else:
+            self.runProfiledCommands()
         self.commands.clear()
         state.epoch += 1
+        # The events of the tick are delivered once all commands are done
+        state.events.dispatch()
+        
+        # The tank is read after the commands, as a level loading replaces it
+        tank = state.level.units[0]
         
-        # Check game over
+        # Check game over: the player's unit is the last live unit when all enemies are destroyed
         if tank.status != "alive":
             state.level.gameOver = True
             self.gameLost()
-        else:
-            oneEnemyStillLives = False
-            for unit in state.level.units:
-                if unit == tank:
-                    continue
-                if unit.status == "alive":
-                    oneEnemyStillLives = True
-                    break
-            if not oneEnemyStillLives:
-                state.level.gameOver = True
-                self.gameWon()
+        elif state.unitArrays.aliveCount == 1:
+            state.level.gameOver = True
+            self.gameWon()
 
 
     
\ No newline at end of file
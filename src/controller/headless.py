@@ -0,0 +1,74 @@
+import time
+from .command import LoadLevelCommand
+
+
+class HeadlessRunner():
+    """
+    Runs a level without any display: the level is loaded with a LoadLevelCommand,
+    then the controller is updated as fast as possible with the inputs of a Player.
+    """
+    def __init__(self,controller,player):
+        self.controller = controller
+        self.player = player
+        self.fileName = None
+
+    def outcome(self):
+        """
+        Returns 'won', 'lost' or 'timeout'
+        """
+        level = self.controller.gameState.level
+        if not level.gameOver:
+            return 'timeout'
+        if level.units[0].status == "alive":
+            return 'won'
+        return 'lost'
+
+    def load(self,fileName):
+        """
+        Load a level, and switch to the Play mode
+        """
+        controller = self.controller
+        state = controller.gameState
+        controller.commands.append(LoadLevelCommand(state,fileName))
+        controller.update()
+        state.currentActiveMode = 'Play'
+        self.fileName = fileName
+        if controller.recordFileName is not None:
+            controller.startRecording(fileName)
+
+    def play(self,maxTicks=100000):
+        """
+        Play the loaded level until it is over or maxTicks ticks were done, and returns a report
+        """
+        controller = self.controller
+        state = controller.gameState
+        ticks = 0
+        startTime = time.perf_counter()
+        while not state.level.gameOver and ticks < maxTicks:
+            moveVector,targetCell,shoot = self.player.nextInput(state)
+            controller.processPlayerInput(moveVector,targetCell,shoot)
+            controller.update()
+            ticks += 1
+        elapsed = time.perf_counter() - startTime
+
+        tank = state.level.units[0]
+        kills = 0
+        for unit in state.level.units:
+            if unit != tank and unit.status != "alive":
+                kills += 1
+        return {
+            'level': self.fileName,
+            'outcome': self.outcome(),
+            'ticks': ticks,
+            'shots': state.bullets.fired,
+            'kills': kills,
+            'seconds': elapsed,
+            'ticksPerSecond': ticks / elapsed if elapsed > 0 else 0.0
+        }
+
+    def run(self,fileName,maxTicks=100000):
+        """
+        Load and play a level, and returns a report
+        """
+        self.load(fileName)
+        return self.play(maxTicks)
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import struct
+import numpy as np
+
+
+class CompiledLevel():
+    """
+    Binary version of a json level file:
+    a header, a table of units as four int16 (position x,y and tile x,y) and uint8 flags (1 for mobile),
+    then the ground and walls tiles as pairs of uint8 (255 for no tile).
+    The header contains the sha1 of the json file it was compiled from.
+    The header and the units are read without the tiles, which are memory mapped.
+    """
+    magic = b'TDLV'
+    version = 3
+    header = struct.Struct('<4sHH20sHHHHI')
+    unit = struct.Struct('<4hB')
+    mobileFlag = 1
+    noTile = 255
+
+    def __init__(self,digest,width,height,cellSize,ground,walls,units):
+        self.digest = digest
+        self.width = width
+        self.height = height
+        self.cellSize = cellSize
+        # Arrays of shape (height,width,2)
+        self.ground = ground
+        self.walls = walls
+        # List of (position x, position y, tile x, tile y, flags)
+        self.units = units
+
+    @staticmethod
+    def cacheFileName(fileName):
+        """
+        Returns the compiled file used as a cache for a json level file
+        """
+        folder,name = os.path.split(fileName)
+        return os.path.join(folder,'.cache',os.path.splitext(name)[0] + '.tdl')
+
+    @staticmethod
+    def encodeArrayLayer(arrayLayer,width,height):
+        array = np.full((height,width,2),CompiledLevel.noTile,dtype=np.uint8)
+        for y in range(len(arrayLayer)):
+            row = arrayLayer[y]
+            for x in range(len(row)):
+                cell = row[x]
+                if cell is None:
+                    continue
+                if not (0 <= cell[0] < CompiledLevel.noTile and 0 <= cell[1] < CompiledLevel.noTile):
+                    raise RuntimeError("Tile {} can't be compiled".format(cell))
+                array[y,x] = cell
+        return array
+
+    @staticmethod
+    def fromJson(data,digest):
+        """
+        Compile the content of a json level file
+        """
+        width = data['width']
+        height = data['height']
+        units = []
+        for unit in data['units']:
+            flags = CompiledLevel.mobileFlag if unit.get('mobile',False) else 0
+            units.append((unit['position'][0],unit['position'][1],unit['direction'][0],unit['direction'][1],flags))
+        return CompiledLevel(
+            digest,width,height,(data['CellSize'][0],data['CellSize'][1]),
+            CompiledLevel.encodeArrayLayer(data['ground'],width,height),
+            CompiledLevel.encodeArrayLayer(data['walls'],width,height),
+            units
+        )
+
+    def encode(self):
+        chunks = [
+            self.header.pack(self.magic,self.version,0,self.digest,self.width,self.height,
+                             self.cellSize[0],self.cellSize[1],len(self.units))
+        ]
+        for unit in self.units:
+            chunks.append(self.unit.pack(*unit))
+        chunks.append(np.ascontiguousarray(self.ground).tobytes())
+        chunks.append(np.ascontiguousarray(self.walls).tobytes())
+        return b''.join(chunks)
+
+    def save(self,fileName):
+        folder = os.path.dirname(fileName)
+        if folder != '':
+            os.makedirs(folder,exist_ok=True)
+        # Write then rename, so a reader never sees a partial file
+        temporaryFileName = fileName + '.tmp'
+        with open(temporaryFileName,'wb') as file:
+            file.write(self.encode())
+        os.replace(temporaryFileName,fileName)
+
+    @staticmethod
+    def load(fileName,digest):
+        """
+        Returns the compiled level in fileName if it matches the digest (or any level if digest is None),
+        otherwise None. Only the header and the units are read, the tiles are memory mapped.
+        """
+        header = CompiledLevel.header
+        try:
+            with open(fileName,'rb') as file:
+                fileSize = os.fstat(file.fileno()).st_size
+                buffer = file.read(header.size)
+                if len(buffer) < header.size:
+                    return None
+                magic,version,flags,fileDigest,width,height,cellWidth,cellHeight,unitCount = header.unpack(buffer)
+                if magic != CompiledLevel.magic or version != CompiledLevel.version \
+                or (digest is not None and fileDigest != digest):
+                    return None
+                layerSize = width * height * 2
+                tilesOffset = header.size + unitCount * CompiledLevel.unit.size
+                if fileSize != tilesOffset + 2 * layerSize:
+                    return None
+                units = list(CompiledLevel.unit.iter_unpack(file.read(tilesOffset - header.size)))
+            ground = CompiledLevel.mapLayer(fileName,tilesOffset,width,height)
+            walls = CompiledLevel.mapLayer(fileName,tilesOffset + layerSize,width,height)
+        except OSError:
+            return None
+        return CompiledLevel(fileDigest,width,height,(cellWidth,cellHeight),ground,walls,units)
+
+    @staticmethod
+    def mapLayer(fileName,offset,width,height):
+        if width * height == 0:
+            return np.zeros((height,width,2),dtype=np.uint8)
+        return np.memmap(fileName,dtype=np.uint8,mode='r',offset=offset,shape=(height,width,2))
+
+
+def fileSignature(fileName):
+    """
+    Returns the size and modification time of a file, None if it doesn't exist
+    """
+    try:
+        info = os.stat(fileName)
+    except OSError:
+        return None
+    return (info.st_size,info.st_mtime_ns)
+
+
+def compileLevel(fileName):
+    """
+    Returns the compiled version of a json level file, from the cache if it is up to date.
+    Otherwise the json file is parsed, and the cache is written if possible.
+    The json file is always read in full to check the cache, a compiled level file (.tdl) is loaded directly.
+    """
+    if fileName.endswith('.tdl'):
+        level = CompiledLevel.load(fileName,None)
+        if level is None:
+            raise RuntimeError("{} is not a compiled level".format(fileName))
+        return level
+
+    with open(fileName,'rb') as file:
+        content = file.read()
+    digest = hashlib.sha1(content).digest()
+    cacheFileName = CompiledLevel.cacheFileName(fileName)
+    level = CompiledLevel.load(cacheFileName,digest)
+    if level is not None:
+        return level
+
+    level = CompiledLevel.fromJson(json.loads(content),digest)
+    try:
+        level.save(cacheFileName)
+    except OSError as ex:
+        print("Can't write level cache {}: {}".format(cacheFileName,ex))
+        return level
+    # The tiles parsed from json are dropped, for the memory mapped ones
+    return CompiledLevel.load(cacheFileName,digest) or level
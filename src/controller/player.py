@@ -0,0 +1,80 @@
+import json
+import random
+from pygame.math import Vector2
+
+
+class Player():
+    """
+    Source of the player's input when the game is not driven by pygame events.
+    Each tick, nextInput() returns a (moveVector, targetCell, shoot) tuple.
+    """
+    def nextInput(self,state):
+        raise NotImplementedError()
+
+
+class RandomPlayer(Player):
+    """
+    A seeded player: it aims at the closest live enemy, moves at random
+    and shoots with a given probability.
+    """
+    def __init__(self,seed=0,moveProbability=0.05,shootProbability=0.1):
+        self.random = random.Random(seed)
+        self.moveProbability = moveProbability
+        self.shootProbability = shootProbability
+
+    def closestEnemy(self,state,tank):
+        closest = None
+        closestDistance = 0
+        for unit in state.level.units:
+            if unit == tank or unit.status != "alive":
+                continue
+            distance = unit.position.distance_squared_to(tank.position)
+            if closest is None or distance < closestDistance:
+                closest = unit
+                closestDistance = distance
+        return closest
+
+    def nextInput(self,state):
+        tank = state.level.units[0]
+        moveVector = Vector2()
+        if self.random.random() < self.moveProbability:
+            moveVector = Vector2(self.random.choice([(1,0),(-1,0),(0,1),(0,-1)]))
+        enemy = self.closestEnemy(state,tank)
+        if enemy is None:
+            targetCell = Vector2(tank.weaponTarget)
+        else:
+            targetCell = Vector2(enemy.position)
+        shoot = self.random.random() < self.shootProbability
+        return moveVector,targetCell,shoot
+
+
+class ScriptedPlayer(Player):
+    """
+    A player that replays a script of inputs keyed by epoch.
+    The target is kept between two entries, moves and shots are not.
+    """
+    def __init__(self,script):
+        self.script = {}
+        for entry in script:
+            self.script[int(entry['epoch'])] = entry
+        self.targetCell = Vector2(0,0)
+
+    @staticmethod
+    def fromFile(fileName):
+        """
+        Load a script from a json file: a list of {"epoch", "move", "target", "shoot"} objects
+        """
+        with open(fileName, 'r') as json_file:
+            return ScriptedPlayer(json.load(json_file))
+
+    def nextInput(self,state):
+        moveVector = Vector2()
+        shoot = False
+        entry = self.script.get(state.epoch)
+        if entry is not None:
+            if 'move' in entry:
+                moveVector = Vector2(entry['move'][0],entry['move'][1])
+            if 'target' in entry:
+                self.targetCell = Vector2(entry['target'][0],entry['target'][1])
+            shoot = bool(entry.get('shoot',False))
+        return moveVector,Vector2(self.targetCell),shoot
@@ -0,0 +1,81 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+
+
+class Profiler():
+    """
+    Rolling timings of the phases of a frame, of each command type and of each layer.
+    Percentiles are computed on the last samples of each timing.
+    When there is no profiler (None), the game loop does not measure anything.
+    """
+    def __init__(self,samples=300,dumpFileName=None,dumpPeriod=5.0):
+        # Timing name -> last durations in seconds
+        self.timings = {}
+        self.samples = samples
+        self.overlayVisible = False
+        # Periodic dump: a .csv file gets one row per timing, other files one json object per line
+        self.dumpFileName = dumpFileName
+        self.dumpPeriod = dumpPeriod
+        self.lastDumpTime = time.perf_counter()
+
+    def add(self,name,seconds):
+        timing = self.timings.get(name)
+        if timing is None:
+            timing = deque(maxlen=self.samples)
+            self.timings[name] = timing
+        timing.append(seconds)
+
+    @staticmethod
+    def percentile(sortedValues,ratio):
+        index = min(len(sortedValues) - 1,int(ratio * len(sortedValues)))
+        return sortedValues[index]
+
+    def report(self):
+        """
+        Returns the p50, p95 and p99 (in milliseconds) and the sample count of each timing
+        """
+        report = {}
+        for name,timing in self.timings.items():
+            values = sorted(timing)
+            if len(values) == 0:
+                continue
+            report[name] = {
+                'p50': 1000 * self.percentile(values,0.50),
+                'p95': 1000 * self.percentile(values,0.95),
+                'p99': 1000 * self.percentile(values,0.99),
+                'count': len(values)
+            }
+        return report
+
+    def toggleOverlay(self):
+        self.overlayVisible = not self.overlayVisible
+
+    def update(self):
+        """
+        Called once per frame: dump the report if the dump period is elapsed
+        """
+        if self.dumpFileName is None:
+            return
+        now = time.perf_counter()
+        if now - self.lastDumpTime < self.dumpPeriod:
+            return
+        self.lastDumpTime = now
+        self.dump(self.dumpFileName)
+
+    def dump(self,fileName):
+        report = self.report()
+        timestamp = time.time()
+        if fileName.endswith('.csv'):
+            newFile = not os.path.exists(fileName)
+            with open(fileName,'a',newline='') as file:
+                writer = csv.writer(file)
+                if newFile:
+                    writer.writerow(['time','name','p50','p95','p99','count'])
+                for name,stats in sorted(report.items()):
+                    writer.writerow([timestamp,name,stats['p50'],stats['p95'],stats['p99'],stats['count']])
+        else:
+            with open(fileName,'a') as file:
+                file.write(json.dumps({ 'time': timestamp, 'timings': report }) + '\n')
@@ -0,0 +1,220 @@
+import bisect
+import hashlib
+import mmap
+import struct
+from pygame.math import Vector2
+from .player import Player
+
+
+# File header: magic, version, keyframe interval, bullet speed, range and delay, level sha1, level file name length
+header = struct.Struct('<4sHIddi20sH')
+magic = b'TDRP'
+version = 3
+# Input record: tag, epoch, move x, move y, shoot, target x, target y
+inputRecord = struct.Struct('<cIbbBdd')
+inputTag = b'I'
+# Keyframe record: tag, epoch, payload size, followed by the payload (a GameState snapshot)
+keyframeRecord = struct.Struct('<cII')
+keyframeTag = b'K'
+
+
+def levelDigest(fileName):
+    with open(fileName,'rb') as file:
+        return hashlib.sha1(file.read()).digest()
+
+
+class ReplayRecorder():
+    """
+    Append the inputs of a level to a replay file, with a keyframe every keyframeInterval epochs
+    """
+    def __init__(self,fileName,state,levelFileName,keyframeInterval=600):
+        self.file = open(fileName,'wb')
+        self.keyframeInterval = keyframeInterval
+        name = levelFileName.encode('utf-8')
+        self.file.write(header.pack(
+            magic,version,keyframeInterval,state.bulletSpeed,state.bulletRange,state.bulletDelay,
+            levelDigest(levelFileName),len(name)
+        ))
+        self.file.write(name)
+        # The state at the start of the recording, so even a replay without input can be played
+        self.writeKeyframe(state)
+
+    def writeKeyframe(self,state):
+        payload = state.snapshot()
+        self.file.write(keyframeRecord.pack(keyframeTag,state.epoch,len(payload)))
+        self.file.write(payload)
+        self.file.flush()
+        self.lastKeyframeEpoch = state.epoch
+
+    def record(self,state,moveVector,targetCell,shoot):
+        """
+        Record the input of the current epoch, preceded by a keyframe if needed
+        """
+        if state.epoch - self.lastKeyframeEpoch >= self.keyframeInterval:
+            self.writeKeyframe(state)
+        self.file.write(inputRecord.pack(
+            inputTag,state.epoch,int(moveVector.x),int(moveVector.y),bool(shoot),targetCell.x,targetCell.y
+        ))
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayFile():
+    """
+    A replay file, memory mapped: only the keyframe index is built when it is opened
+    """
+    def __init__(self,fileName):
+        self.file = open(fileName,'rb')
+        self.buffer = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        (fileMagic,fileVersion,self.keyframeInterval,self.bulletSpeed,self.bulletRange,self.bulletDelay,
+         self.levelDigest,nameSize) = header.unpack_from(self.buffer,0)
+        if fileMagic != magic or fileVersion != version:
+            raise RuntimeError("{} is not a replay file".format(fileName))
+        offset = header.size
+        self.levelFileName = self.buffer[offset:offset+nameSize].decode('utf-8')
+        self.dataOffset = offset + nameSize
+
+        # Keyframes index: list of (epoch, record offset), and the last recorded epoch
+        self.keyframes = []
+        self.lastEpoch = None
+        for tag,epoch,offset in self.records(self.dataOffset):
+            if tag == keyframeTag:
+                self.keyframes.append((epoch,offset))
+            else:
+                self.lastEpoch = epoch
+
+    @property
+    def endEpoch(self):
+        """
+        Returns the epoch following the last input, or the epoch of the last keyframe if it is after it.
+        None if the replay is empty.
+        """
+        if not self.keyframes:
+            return None
+        if self.lastEpoch is None:
+            return self.keyframes[-1][0]
+        return max(self.lastEpoch + 1,self.keyframes[-1][0])
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+    def records(self,offset):
+        """
+        Iterate over the (tag, epoch, offset) of the records, starting at a record offset
+        """
+        buffer = self.buffer
+        size = len(buffer)
+        while offset < size:
+            tag = buffer[offset:offset+1]
+            if tag == inputTag:
+                if offset + inputRecord.size > size:
+                    return
+                yield tag,struct.unpack_from('<I',buffer,offset+1)[0],offset
+                offset += inputRecord.size
+            elif tag == keyframeTag:
+                tag,epoch,payloadSize = keyframeRecord.unpack_from(buffer,offset)
+                if offset + keyframeRecord.size + payloadSize > size:
+                    return
+                yield tag,epoch,offset
+                offset += keyframeRecord.size + payloadSize
+            else:
+                raise RuntimeError("Corrupted replay record at {}".format(offset))
+
+    def input(self,offset):
+        """
+        Returns the (epoch, moveVector, targetCell, shoot) of the input record at offset
+        """
+        tag,epoch,moveX,moveY,shoot,targetX,targetY = inputRecord.unpack_from(self.buffer,offset)
+        return epoch,Vector2(moveX,moveY),Vector2(targetX,targetY),bool(shoot)
+
+    def configure(self,state):
+        """
+        Set the parameters of the recording in the state
+        """
+        state.bulletSpeed = self.bulletSpeed
+        state.bulletRange = self.bulletRange
+        state.bulletDelay = self.bulletDelay
+
+    def keyframeBefore(self,epoch):
+        """
+        Returns the (epoch, offset) of the last keyframe at or before epoch
+        """
+        index = bisect.bisect_right(self.keyframes,(epoch,len(self.buffer)))
+        if index == 0:
+            raise RuntimeError("No keyframe before epoch {}".format(epoch))
+        return self.keyframes[index-1]
+
+    def restoreKeyframe(self,state,offset):
+        tag,epoch,payloadSize = keyframeRecord.unpack_from(self.buffer,offset)
+        start = offset + keyframeRecord.size
+        state.restore(self.buffer[start:start+payloadSize])
+
+
+class ReplayPlayer(Player):
+    """
+    A player that plays the inputs of a replay file. It can seek to any epoch:
+    the closest keyframe is restored, then the inputs after it are simulated.
+    """
+    def __init__(self,replay):
+        self.replay = replay
+        self.records = None
+        self.pending = None
+        self.finished = False
+        self.rewind(replay.keyframes[0][1] if replay.keyframes else replay.dataOffset)
+
+    def rewind(self,offset):
+        self.records = self.replay.records(offset)
+        self.pending = None
+        self.finished = False
+
+    def nextRecord(self,state):
+        """
+        Returns the input record of the current epoch, or None
+        """
+        while True:
+            if self.pending is None:
+                record = next(self.records,None)
+                if record is None:
+                    self.finished = True
+                    return None
+                if record[0] != inputTag:
+                    continue
+                self.pending = record
+            epoch = self.pending[1]
+            if epoch > state.epoch:
+                return None
+            record = self.pending
+            self.pending = None
+            if epoch == state.epoch:
+                return record
+
+    def nextInput(self,state):
+        record = self.nextRecord(state)
+        if record is None:
+            tank = state.level.units[0]
+            return Vector2(),Vector2(tank.weaponTarget),False
+        epoch,moveVector,targetCell,shoot = self.replay.input(record[2])
+        return moveVector,targetCell,shoot
+
+    def seek(self,controller,epoch=None):
+        """
+        Bring the state of the controller to the beginning of an epoch (the first keyframe by default).
+        Epochs after the end of the replay go to its end.
+        """
+        replay = self.replay
+        if not replay.keyframes:
+            # Nothing was recorded, the loaded level is the whole replay
+            return
+        if epoch is None:
+            epoch = replay.keyframes[0][0]
+        epoch = min(epoch,replay.endEpoch)
+        state = controller.gameState
+        keyframeEpoch,offset = replay.keyframeBefore(epoch)
+        replay.restoreKeyframe(state,offset)
+        self.rewind(offset)
+        while state.epoch < epoch and not self.finished:
+            moveVector,targetCell,shoot = self.nextInput(state)
+            controller.processPlayerInput(moveVector,targetCell,shoot)
+            controller.update()
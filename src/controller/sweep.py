@@ -0,0 +1,137 @@
+import csv
+import itertools
+import multiprocessing
+import random
+import numpy as np
+from model import GameState
+from pygame.math import Vector2
+from .game_controller import GameController
+from .headless import HeadlessRunner
+from .player import RandomPlayer
+
+
+# Columns of the per game results, and parameters identifying a configuration
+resultColumns = ['level','bulletSpeed','bulletRange','bulletDelay','placement','seed','outcome','ticks','shots','kills','seconds']
+configurationColumns = ['level','bulletSpeed','bulletRange','bulletDelay','placement']
+summaryColumns = configurationColumns + ['games','wins','losses','timeouts','winRate','meanTicks','meanShots','meanKills']
+
+
+def sweepTasks(levels,bulletSpeeds,bulletRanges,bulletDelays,placements,seeds,maxTicks):
+    """
+    Returns the tasks of a sweep: one per level, parameter values, placement and seed.
+    Placement 0 keeps the units of the level, other placements move the enemies at random.
+    """
+    for level,bulletSpeed,bulletRange,bulletDelay,placement,seed in itertools.product(
+        levels,bulletSpeeds,bulletRanges,bulletDelays,range(placements),range(seeds)
+    ):
+        yield {
+            'level': level,
+            'bulletSpeed': bulletSpeed,
+            'bulletRange': bulletRange,
+            'bulletDelay': bulletDelay,
+            'placement': placement,
+            'seed': seed,
+            'maxTicks': maxTicks
+        }
+
+
+def placeUnits(state,seed):
+    """
+    Move each enemy to a random free cell (no wall and no other unit)
+    """
+    rng = random.Random(seed)
+    level = state.level
+    free = level.passableRegion(0,0,state.worldWidth,state.worldHeight)
+    for unit in level.units:
+        x = int(unit.position.x)
+        y = int(unit.position.y)
+        if 0 <= x < state.worldWidth and 0 <= y < state.worldHeight:
+            free[y,x] = False
+    freeCells = [ (x,y) for y,x in np.argwhere(free).tolist() ]
+    tank = level.units[0]
+    enemies = [ unit for unit in level.units if unit != tank ]
+    cells = rng.sample(freeCells,min(len(enemies),len(freeCells)))
+    for unit,cell in zip(enemies,cells):
+        state.moveUnit(unit,Vector2(cell))
+
+
+def playGame(task):
+    """
+    Play one game of a sweep, in a new game state, and returns its result row
+    """
+    GameState.resetInstance()
+    controller = GameController()
+    state = controller.gameState
+    state.bulletSpeed = task['bulletSpeed']
+    state.bulletRange = task['bulletRange']
+    state.bulletDelay = task['bulletDelay']
+
+    runner = HeadlessRunner(controller,RandomPlayer(task['seed']))
+    runner.load(task['level'])
+    if task['placement'] > 0:
+        placeUnits(state,task['placement'])
+    report = runner.play(task['maxTicks'])
+
+    result = { column: task[column] for column in configurationColumns + ['seed'] }
+    for column in ['outcome','ticks','shots','kills','seconds']:
+        result[column] = report[column]
+    return result
+
+
+class SweepSummary():
+    """
+    Aggregated results of the games, per configuration
+    """
+    def __init__(self):
+        self.configurations = {}
+
+    def add(self,result):
+        key = tuple(result[column] for column in configurationColumns)
+        stats = self.configurations.get(key)
+        if stats is None:
+            stats = { 'games': 0, 'won': 0, 'lost': 0, 'timeout': 0, 'ticks': 0, 'shots': 0, 'kills': 0 }
+            self.configurations[key] = stats
+        stats['games'] += 1
+        stats[result['outcome']] += 1
+        stats['ticks'] += result['ticks']
+        stats['shots'] += result['shots']
+        stats['kills'] += result['kills']
+
+    def rows(self):
+        for key in sorted(self.configurations):
+            stats = self.configurations[key]
+            games = stats['games']
+            row = dict(zip(configurationColumns,key))
+            row.update({
+                'games': games,
+                'wins': stats['won'],
+                'losses': stats['lost'],
+                'timeouts': stats['timeout'],
+                'winRate': stats['won'] / games,
+                'meanTicks': stats['ticks'] / games,
+                'meanShots': stats['shots'] / games,
+                'meanKills': stats['kills'] / games
+            })
+            yield row
+
+    def save(self,fileName):
+        with open(fileName,'w',newline='') as file:
+            writer = csv.DictWriter(file,fieldnames=summaryColumns)
+            writer.writeheader()
+            writer.writerows(self.rows())
+
+
+def runSweep(tasks,resultsFileName,workers=None,chunkSize=16):
+    """
+    Play all the tasks on a pool of processes. The result of each game is written
+    to resultsFileName as soon as it is available, and the summary is returned.
+    """
+    summary = SweepSummary()
+    with open(resultsFileName,'w',newline='') as file:
+        writer = csv.DictWriter(file,fieldnames=resultColumns)
+        writer.writeheader()
+        with multiprocessing.Pool(workers) as pool:
+            for result in pool.imap_unordered(playGame,tasks,chunkSize):
+                writer.writerow(result)
+                summary.add(result)
+    return summary
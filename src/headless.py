@@ -0,0 +1,48 @@
+import argparse
+import hashlib
+from controller import GameController, HeadlessRunner, RandomPlayer, ScriptedPlayer, ReplayFile, ReplayPlayer
+from controller.replay import levelDigest
+
+
+parser = argparse.ArgumentParser(description="Run levels without display, as fast as possible")
+parser.add_argument('levels', nargs='*', help="level files, e.g. levels/level1.json")
+parser.add_argument('--ticks', type=int, default=100000, help="maximum number of ticks per level")
+parser.add_argument('--seed', type=int, default=0, help="seed of the random player")
+parser.add_argument('--script', help="json script of inputs to use instead of the random player")
+parser.add_argument('--record', help="replay file where the inputs of the levels are recorded")
+parser.add_argument('--replay', help="replay file to play instead of the levels")
+parser.add_argument('--seek', type=int, help="with --replay, epoch where the replay starts")
+args = parser.parse_args()
+
+
+def printReport(report,state):
+    # The digest of the final state allows to compare two runs
+    print("{}: {} after {} ticks, {} shots, {} kills in {:.3f}s ({:.0f} ticks/s), state {}".format(
+        report['level'],report['outcome'],report['ticks'],report['shots'],report['kills'],
+        report['seconds'],report['ticksPerSecond'],hashlib.sha1(state.snapshot()).hexdigest()[:12]
+    ))
+
+
+controller = GameController()
+state = controller.gameState
+if args.replay is not None:
+    replay = ReplayFile(args.replay)
+    replay.configure(state)
+    if levelDigest(replay.levelFileName) != replay.levelDigest:
+        print("Warning: {} changed since the recording".format(replay.levelFileName))
+    player = ReplayPlayer(replay)
+    runner = HeadlessRunner(controller,player)
+    runner.load(replay.levelFileName)
+    player.seek(controller,args.seek)
+    endEpoch = replay.endEpoch
+    printReport(runner.play(0 if endEpoch is None else max(0,endEpoch - state.epoch)),state)
+else:
+    controller.recordFileName = args.record
+    for fileName in args.levels:
+        if args.script is not None:
+            player = ScriptedPlayer.fromFile(args.script)
+        else:
+            player = RandomPlayer(args.seed)
+        runner = HeadlessRunner(controller,player)
+        printReport(runner.run(fileName,args.ticks),state)
+    controller.stopRecording()
@@ -1,8 +1,39 @@
+import time
+startTime = time.perf_counter()
+import argparse
 from view import UserInterface
+from controller import Profiler, ReplayFile, ReplayPlayer
 import pygame
+importTime = time.perf_counter()
 
-userInterface = UserInterface()
+parser = argparse.ArgumentParser(description="Tower Defense")
+parser.add_argument('--profile', action='store_true', help="time each frame phase, command type and layer (F3 shows the timings)")
+parser.add_argument('--profile-dump', help="file where the timings are appended every few seconds (.csv, otherwise json lines)")
+parser.add_argument('--record', help="replay file where the inputs of each loaded level are recorded")
+parser.add_argument('--replay', help="replay file to watch")
+parser.add_argument('--seek', type=int, help="with --replay, epoch where the replay starts")
+parser.add_argument('--fps', type=int, default=60, help="maximum frame rate, the game itself always runs 60 ticks per second")
+parser.add_argument('--startup-report', action='store_true', help="print the startup time of each phase, and the loading time of each asset")
+args = parser.parse_args()
+
+profiler = None
+if args.profile or args.profile_dump is not None:
+    profiler = Profiler(dumpFileName=args.profile_dump)
+
+userInterface = UserInterface(profiler=profiler,frameRate=args.fps)
+if args.startup_report:
+    # The times of the next phases are counted from the start too (see UserInterface.updateStartupReport)
+    userInterface.startupStartTime = startTime
+    userInterface.startupTimes = [ ("import",importTime - startTime), ("init",time.perf_counter() - importTime) ]
+controller = userInterface.controller
+controller.recordFileName = args.record
+if args.replay is not None:
+    replay = ReplayFile(args.replay)
+    replay.configure(controller.gameState)
+    controller.player = ReplayPlayer(replay)
+    controller.loadLevelRequested(replay.levelFileName)
+    controller.player.seek(controller,args.seek)
 userInterface.run()
+controller.stopRecording()
 
 pygame.quit()
-    
\ No newline at end of file
@@ -0,0 +1,396 @@
+import math
+import numpy as np
+from pygame.math import Vector2
+
+
+class BulletStore():
+    """
+    All the live bullets, stored as a structure of arrays.
+    Only the first count rows of each array are used, in firing order.
+    """
+    tile = Vector2(2,1)
+    # Up to this number of bullets, step uses a loop over the bullets (stepFew)
+    fewBullets = 32
+
+    def __init__(self,capacity=64):
+        self.count = 0
+        # Number of bullets fired since the last clear
+        self.fired = 0
+        # Cells of the live units, see unitCells
+        self.unitCellKeys = None
+        self.unitCellUnits = None
+        self.unitCellsKey = None
+        self.allocate(capacity)
+
+    def allocate(self,capacity):
+        """
+        Resize the arrays, keeping the current bullets
+        """
+        count = self.count
+        position = np.zeros((capacity,2))
+        direction = np.zeros((capacity,2))
+        start = np.zeros((capacity,2))
+        end = np.zeros((capacity,2))
+        ranges = np.zeros(capacity)
+        owner = np.zeros(capacity,dtype=np.int32)
+        if count > 0:
+            position[:count] = self.position[:count]
+            direction[:count] = self.direction[:count]
+            start[:count] = self.start[:count]
+            end[:count] = self.end[:count]
+            ranges[:count] = self.range[:count]
+            owner[:count] = self.owner[:count]
+        self.position = position
+        self.direction = direction
+        self.start = start
+        self.end = end
+        self.range = ranges
+        self.owner = owner
+        self.alive = np.zeros(capacity,dtype=bool)
+        self.alive[:count] = True
+
+    @property
+    def capacity(self):
+        return len(self.range)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+        self.fired = 0
+        self.alive[:] = False
+
+    def add(self,unit,range):
+        """
+        Fire a bullet from a unit towards its weapon target
+        """
+        start = unit.position
+        end = unit.weaponTarget
+        if self.count == self.capacity:
+            self.allocate(2 * self.capacity)
+        index = self.count
+        self.count += 1
+        self.fired += 1
+        direction = end - start
+        if direction.length_squared() > 0:
+            direction.normalize_ip()
+        self.position[index] = (start.x,start.y)
+        self.direction[index] = (direction.x,direction.y)
+        self.start[index] = (start.x,start.y)
+        self.end[index] = (end.x,end.y)
+        self.range[index] = range
+        self.owner[index] = unit.index
+        # A bullet without direction can't move
+        self.alive[index] = direction.x != 0 or direction.y != 0
+
+    def snapshot(self):
+        """
+        Returns the arrays of the bullets as bytes, one array after the other
+        """
+        count = self.count
+        return b''.join([ array[:count].tobytes() for array in self.arrays() ])
+
+    def restore(self,buffer,offset,count,fired):
+        """
+        Restore count bullets from a snapshot at offset in buffer, and returns the offset after them
+        """
+        self.clear()
+        while self.capacity < count:
+            self.allocate(2 * self.capacity)
+        for array in self.arrays():
+            rows = array[:count]
+            rows[...] = np.frombuffer(buffer,dtype=array.dtype,count=rows.size,offset=offset).reshape(rows.shape)
+            offset += rows.nbytes
+        self.count = count
+        self.alive[:count] = True
+        self.fired = fired
+        return offset
+
+    def arrays(self):
+        return (self.position,self.direction,self.start,self.end,self.range,self.owner)
+
+    def unitCells(self,state):
+        """
+        Returns the cells of the live units as sorted keys (x + (worldWidth + 1) * y), and the unit index of each key.
+        The first unit wins if several units share a cell. The arrays have one row per unit whatever the size
+        of the world, and they are only built again when a unit moves or is destroyed.
+        """
+        arrays = state.unitArrays
+        width = state.worldWidth
+        height = state.worldHeight
+        key = (arrays.cellsVersion,width,height)
+        if self.unitCellsKey != key:
+            units = np.flatnonzero(arrays.alive)
+            cells = arrays.position[units].astype(np.int64)
+            x = cells[:,0]
+            y = cells[:,1]
+            # Cells on the extra row and column of the edges are kept, for the centers of bullets on the edges
+            inside = (x >= 0) & (x <= width) & (y >= 0) & (y <= height)
+            keys = x[inside] + (width + 1) * y[inside]
+            units = units[inside]
+            order = np.argsort(keys,kind='stable')
+            keys = keys[order]
+            units = units[order]
+            first = np.ones(len(keys),dtype=bool)
+            first[1:] = keys[1:] != keys[:-1]
+            self.unitCellKeys = keys[first]
+            self.unitCellUnits = units[first]
+            self.unitCellsKey = key
+        return self.unitCellKeys,self.unitCellUnits
+
+    @staticmethod
+    def unitsAt(keys,units,cellKeys):
+        """
+        Returns the unit index in each cell of cellKeys, or -1 (keys and units come from unitCells)
+        """
+        if len(keys) == 0:
+            return np.full(len(cellKeys),-1,dtype=np.int64)
+        found = np.minimum(np.searchsorted(keys,cellKeys),len(keys) - 1)
+        return np.where(keys[found] == cellKeys,units[found],-1)
+
+    def stepLimits(self,state,count):
+        """
+        Returns the distance each bullet can travel before it leaves the world,
+        reaches its target or exceeds its range
+        """
+        position = self.position[:count]
+        direction = self.direction[:count]
+        x = position[:,0]
+        y = position[:,1]
+        dx = direction[:,0]
+        dy = direction[:,1]
+        with np.errstate(divide='ignore',invalid='ignore'):
+            worldX = np.where(dx > 0,(state.worldWidth - x) / dx,np.where(dx < 0,x / -dx,np.inf))
+            worldY = np.where(dy > 0,(state.worldHeight - y) / dy,np.where(dy < 0,y / -dy,np.inf))
+        target = ((self.end[:count] - position) * direction).sum(axis=1)
+        travelled = ((position - self.start[:count]) * direction).sum(axis=1)
+        return np.minimum(np.minimum(worldX,worldY),np.minimum(target,self.range[:count] - travelled))
+
+    def step(self,state):
+        """
+        Move all bullets, destroy the ones that leave the world, reach their target,
+        exceed their range, hit a wall or hit a unit (the unit is also destroyed).
+        The segment travelled during the step is swept cell by cell (Amanatides and Woo),
+        so no wall or unit is missed whatever the speed of the bullets.
+        """
+        count = self.count
+        if count == 0:
+            return
+        if count <= BulletStore.fewBullets:
+            self.stepFew(state,count)
+        else:
+            self.stepMany(state,count)
+        self.compact()
+
+    def stepMany(self,state,count):
+        """
+        Step the bullets with array operations, all the bullets crossing cells in lockstep
+        """
+        speed = state.bulletSpeed
+        alive = self.alive[:count]
+        candidates = np.flatnonzero(alive)
+        limits = self.stepLimits(state,count)
+        length = np.minimum(limits,speed)
+        # Bullets stopped during the step, even if they hit nothing
+        alive &= limits > speed
+
+        # Cells are the ones of the bullet centers: the cell of a position is floor(position + 0.5)
+        center = self.position[:count] + 0.5
+        direction = self.direction[:count]
+        cellX = np.floor(center[:,0]).astype(np.int32)
+        cellY = np.floor(center[:,1]).astype(np.int32)
+        dx = direction[:,0]
+        dy = direction[:,1]
+        stepX = np.sign(dx).astype(np.int32)
+        stepY = np.sign(dy).astype(np.int32)
+        # Distance to cross one cell, and to the next cell border
+        with np.errstate(divide='ignore',invalid='ignore'):
+            deltaX = np.abs(1 / dx)
+            deltaY = np.abs(1 / dy)
+            maxX = np.where(dx > 0,(cellX + 1 - center[:,0]) * deltaX,np.where(dx < 0,(center[:,0] - cellX) * deltaX,np.inf))
+            maxY = np.where(dy > 0,(cellY + 1 - center[:,1]) * deltaY,np.where(dy < 0,(center[:,1] - cellY) * deltaY,np.inf))
+
+        cellKeys,cellUnits = self.unitCells(state)
+        level = state.level
+        width = state.worldWidth
+        height = state.worldHeight
+        owner = self.owner
+        # Index of the unit hit by each bullet, -1 for a wall, -2 for nothing
+        hits = np.full(count,-2,dtype=np.int32)
+
+        # The current cell is tested first, then all bullets cross cells in lockstep until the end of their segment.
+        # A unit is only destroyed by the first bullet that hits it: the others go through its wreck,
+        # and continue their segment from its cell.
+        pending = candidates
+        while len(pending) > 0:
+            active = pending
+            while True:
+                x = np.clip(cellX[active],0,width)
+                y = np.clip(cellY[active],0,height)
+                units = self.unitsAt(cellKeys,cellUnits,x + (width + 1) * y)
+                hitUnit = (units >= 0) & (units != owner[active])
+                # The extra row and column have no wall
+                hitWall = ~level.passableCells(x,y) & (x < width) & (y < height)
+                hits[active[hitUnit]] = units[hitUnit]
+                hits[active[hitWall & ~hitUnit]] = -1
+                active = active[~(hitUnit | hitWall)]
+
+                nextX = maxX[active]
+                nextY = maxY[active]
+                crossing = np.minimum(nextX,nextY) <= length[active]
+                active = active[crossing]
+                if len(active) == 0:
+                    break
+                alongX = nextX[crossing] < nextY[crossing]
+                movingX = active[alongX]
+                movingY = active[~alongX]
+                cellX[movingX] += stepX[movingX]
+                maxX[movingX] += deltaX[movingX]
+                cellY[movingY] += stepY[movingY]
+                maxY[movingY] += deltaY[movingY]
+
+            hitting = pending[hits[pending] >= 0]
+            if len(hitting) == 0:
+                break
+            units,first = np.unique(hits[hitting],return_index=True)
+            for unitIndex in units[np.argsort(first)]:
+                state.destroyUnit(level.units[unitIndex])
+            # The wrecks don't stop the bullets
+            cellUnits = np.where(np.isin(cellUnits,units),-1,cellUnits)
+            through = np.ones(len(hitting),dtype=bool)
+            through[first] = False
+            pending = hitting[through]
+            hits[pending] = -2
+
+        # Bullets that hit a wall or a unit other than their owner
+        alive &= hits == -2
+
+        # Nothing happens to the others, they continue their trajectory
+        self.position[:count][alive] += speed * direction[alive]
+
+    def stepFew(self,state,count):
+        """
+        Step the bullets one by one, with the same operations and results as stepMany.
+        For a few bullets, the loop costs less than the array operations.
+        The units are looked up in the unit grid, the walls with Level.isPassable.
+        """
+        speed = state.bulletSpeed
+        width = state.worldWidth
+        height = state.worldHeight
+        level = state.level
+        units = level.units
+        cells = state.unitGrid.cells
+        positions = self.position[:count].tolist()
+        directions = self.direction[:count].tolist()
+        starts = self.start[:count].tolist()
+        ends = self.end[:count].tolist()
+        ranges = self.range[:count].tolist()
+        owners = self.owner[:count].tolist()
+        alive = self.alive[:count].tolist()
+        candidates = [ index for index in range(count) if alive[index] ]
+        # Traversal of each candidate: cell, next cell borders, steps and length of the step
+        walks = {}
+        for index in candidates:
+            x,y = positions[index]
+            dx,dy = directions[index]
+            worldX = (width - x) / dx if dx > 0 else x / -dx if dx < 0 else math.inf
+            worldY = (height - y) / dy if dy > 0 else y / -dy if dy < 0 else math.inf
+            endX,endY = ends[index]
+            startX,startY = starts[index]
+            target = (endX - x) * dx + (endY - y) * dy
+            travelled = (x - startX) * dx + (y - startY) * dy
+            limit = min(min(worldX,worldY),min(target,ranges[index] - travelled))
+            alive[index] = limit > speed
+            centerX = x + 0.5
+            centerY = y + 0.5
+            cellX = math.floor(centerX)
+            cellY = math.floor(centerY)
+            deltaX = abs(1 / dx) if dx != 0 else math.inf
+            deltaY = abs(1 / dy) if dy != 0 else math.inf
+            maxX = (cellX + 1 - centerX) * deltaX if dx > 0 else (centerX - cellX) * deltaX if dx < 0 else math.inf
+            maxY = (cellY + 1 - centerY) * deltaY if dy > 0 else (centerY - cellY) * deltaY if dy < 0 else math.inf
+            stepX = 1 if dx > 0 else -1 if dx < 0 else 0
+            stepY = 1 if dy > 0 else -1 if dy < 0 else 0
+            walks[index] = [cellX,cellY,maxX,maxY,stepX,stepY,deltaX,deltaY,min(limit,speed)]
+
+        # Units destroyed during this step: like in stepMany, their cell no longer stops the bullets
+        wrecks = set()
+
+        def unitAt(x,y):
+            # First unit of the cell by index among the units alive at the start of the step
+            first = -1
+            for unit in cells.get((x,y),()):
+                if (unit.status == "alive" or unit.index in wrecks) and (first < 0 or unit.index < first):
+                    first = unit.index
+            return -1 if first in wrecks else first
+
+        def walk(index):
+            cell = walks[index]
+            cellX,cellY,maxX,maxY,stepX,stepY,deltaX,deltaY,length = cell
+            owner = owners[index]
+            while True:
+                x = min(max(cellX,0),width)
+                y = min(max(cellY,0),height)
+                unit = unitAt(x,y)
+                if unit >= 0 and unit != owner:
+                    hit = unit
+                    break
+                if x < width and y < height and not level.isPassable(x,y):
+                    hit = -1
+                    break
+                if min(maxX,maxY) > length:
+                    hit = -2
+                    break
+                if maxX < maxY:
+                    cellX += stepX
+                    maxX += deltaX
+                else:
+                    cellY += stepY
+                    maxY += deltaY
+            cell[:4] = cellX,cellY,maxX,maxY
+            return hit
+
+        hits = {}
+        pending = candidates
+        while pending:
+            for index in pending:
+                hits[index] = walk(index)
+            hitting = [ index for index in pending if hits[index] >= 0 ]
+            if not hitting:
+                break
+            # First bullet hitting each unit, in bullet order
+            first = {}
+            for index in hitting:
+                first.setdefault(hits[index],index)
+            for unitIndex in first:
+                state.destroyUnit(units[unitIndex])
+            wrecks.update(first)
+            pending = [ index for index in hitting if first[hits[index]] != index ]
+            for index in pending:
+                hits[index] = -2
+
+        position = self.position
+        for index in candidates:
+            if alive[index] and hits[index] == -2:
+                x,y = positions[index]
+                dx,dy = directions[index]
+                position[index] = (x + speed * dx,y + speed * dy)
+            else:
+                alive[index] = False
+        self.alive[:count] = alive
+
+    def compact(self):
+        """
+        Remove the destroyed bullets, keeping the firing order
+        """
+        count = self.count
+        alive = self.alive[:count]
+        newCount = int(np.count_nonzero(alive))
+        if newCount == count:
+            return
+        for array in self.arrays():
+            array[:newCount] = array[:count][alive]
+        self.alive[:newCount] = True
+        self.alive[newCount:count] = False
+        self.count = newCount
@@ -0,0 +1,60 @@
+from pygame.math import Vector2
+
+
+class Camera():
+    """
+    The part of the world shown in the window: x and y are the world pixel at the top left
+    corner of the window, and width and height the size of the window.
+    """
+    def __init__(self):
+        self.x = 0
+        self.y = 0
+        self.width = 0
+        self.height = 0
+
+    @property
+    def origin(self):
+        return Vector2(self.x,self.y)
+
+    def setViewport(self,width,height):
+        self.width = width
+        self.height = height
+
+    def follow(self,state,position):
+        """
+        Center the view on the cell of position, without showing anything outside the world.
+        Returns True if the camera moved.
+        """
+        cellWidth = state.level.cellWidth
+        cellHeight = state.level.cellHeight
+        worldWidth = state.worldWidth * cellWidth
+        worldHeight = state.worldHeight * cellHeight
+        x = int(position.x * cellWidth) + cellWidth // 2 - self.width // 2
+        y = int(position.y * cellHeight) + cellHeight // 2 - self.height // 2
+        x = max(0,min(x,worldWidth - self.width))
+        y = max(0,min(y,worldHeight - self.height))
+        if x == self.x and y == self.y:
+            return False
+        self.x = x
+        self.y = y
+        return True
+
+    def screenToCell(self,state,point):
+        """
+        Returns the cell coordinates of a window pixel, as floats
+        """
+        return Vector2(
+            (point[0] + self.x) / state.level.cellWidth,
+            (point[1] + self.y) / state.level.cellHeight
+        )
+
+    def visibleCells(self,cellWidth,cellHeight,margin=1):
+        """
+        Returns the range (x0, y0, x1, y1) of cells at least partly visible, x1 and y1 excluded.
+        margin cells are added on each side, for the tiles drawn larger than their cell.
+        """
+        x0 = self.x // cellWidth - margin
+        y0 = self.y // cellHeight - margin
+        x1 = (self.x + self.width - 1) // cellWidth + 1 + margin
+        y1 = (self.y + self.height - 1) // cellHeight + 1 + margin
+        return x0,y0,x1,y1
@@ -0,0 +1,56 @@
+class EventBus():
+    """
+    Typed channels of game state events.
+    Events are queued during a simulation tick, and delivered once per tick by dispatch():
+    each handler is called once with the list of the events of its type, in publishing order.
+    Events without subscribers are not queued.
+    """
+    def __init__(self):
+        # Handlers, by event type
+        self.subscribers = {}
+        # Queued events, by event type, in the order the types were first published
+        self.pending = {}
+
+    def subscribe(self,eventType,handler):
+        self.subscribers.setdefault(eventType,[]).append(handler)
+
+    def unsubscribe(self,eventType,handler):
+        handlers = self.subscribers.get(eventType)
+        if handlers is not None and handler in handlers:
+            handlers.remove(handler)
+            if len(handlers) == 0:
+                del self.subscribers[eventType]
+
+    def isSubscribed(self,eventType):
+        """
+        Returns True if events of this type are delivered, so publishers can skip creating them
+        """
+        return eventType in self.subscribers
+
+    def publish(self,event):
+        eventType = type(event)
+        if eventType not in self.subscribers:
+            return
+        events = self.pending.get(eventType)
+        if events is None:
+            self.pending[eventType] = [ event ]
+        elif eventType.coalesce:
+            events[0] = event
+        else:
+            events.append(event)
+
+    def dispatch(self):
+        """
+        Deliver the queued events
+        """
+        if len(self.pending) == 0:
+            return
+        pending = self.pending
+        # Handlers may publish new events, they are delivered at the next dispatch
+        self.pending = {}
+        for eventType,events in pending.items():
+            for handler in self.subscribers.get(eventType,()):
+                handler(events)
+
+    def clear(self):
+        self.pending.clear()
@@ -0,0 +1,80 @@
+from collections import deque
+from pygame.math import Vector2
+
+
+class FlowField():
+    """
+    Distance (in moves) from every cell to a target cell, going around the walls.
+    Units follow the field by moving to a neighbour cell with a smaller distance.
+    The field is only computed again when the target cell or the walls change.
+    """
+    unreachable = -1
+    moves = [ Vector2(1,0), Vector2(-1,0), Vector2(0,1), Vector2(0,-1) ]
+
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        # Distances, row after row
+        self.distances = []
+        self.target = None
+        self.wallsVersion = None
+
+    def update(self,state,target):
+        """
+        Compute the field towards the cell of target, if needed
+        """
+        level = state.level
+        cell = (int(target.x),int(target.y))
+        if cell == self.target and level.wallsVersion == self.wallsVersion \
+        and self.width == state.worldWidth and self.height == state.worldHeight:
+            return
+        self.target = cell
+        self.wallsVersion = level.wallsVersion
+        self.width = width = state.worldWidth
+        self.height = height = state.worldHeight
+
+        # Breadth first search from the target cell
+        passable = level.passableRegion(0,0,width,height).ravel().tolist()
+        distances = [ FlowField.unreachable ] * (width * height)
+        distances[cell[1] * width + cell[0]] = 0
+        queue = deque([ cell ])
+        while queue:
+            x,y = queue.popleft()
+            distance = distances[y * width + x] + 1
+            for nextX,nextY in ((x+1,y),(x-1,y),(x,y+1),(x,y-1)):
+                if nextX < 0 or nextX >= width or nextY < 0 or nextY >= height:
+                    continue
+                index = nextY * width + nextX
+                if distances[index] != FlowField.unreachable or not passable[index]:
+                    continue
+                distances[index] = distance
+                queue.append((nextX,nextY))
+        self.distances = distances
+
+    def distance(self,x,y):
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return FlowField.unreachable
+        return self.distances[y * self.width + x]
+
+    def nextMove(self,state,position):
+        """
+        Returns the move towards the target from position, avoiding cells with units, or None
+        """
+        x = int(position.x)
+        y = int(position.y)
+        current = self.distance(x,y)
+        if current <= 0:
+            return None
+        bestMove = None
+        bestDistance = current
+        for move in FlowField.moves:
+            nextX = x + int(move.x)
+            nextY = y + int(move.y)
+            distance = self.distance(nextX,nextY)
+            if distance == FlowField.unreachable or distance >= bestDistance:
+                continue
+            if state.findUnit(Vector2(nextX,nextY)) is not None:
+                continue
+            bestMove = move
+            bestDistance = distance
+        return bestMove
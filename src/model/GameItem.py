@@ -2,6 +2,9 @@ import math
 from pygame.math import Vector2
 
 class GameItem():
+    # No per instance dictionary: levels can hold many items
+    __slots__ = ('status','position','tile','orientation')
+
     def __init__(self,position,tile):
         self.status = "alive"
         self.position = position
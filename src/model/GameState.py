@@ -1,18 +1,40 @@
+import struct
 from pygame.math import Vector2
 from .Unit import Unit
 from .Level import Level
 from .Menu import Menu
+from .UnitGrid import UnitGrid
+from .UnitArrays import UnitArrays
+from .BulletStore import BulletStore
+from .FlowField import FlowField
+from .LineOfSight import LineOfSight
+from .EventBus import EventBus
+from .Camera import Camera
+from .events import UnitDestroyedEvent
 
 
 class GameState():
     _instance = None
 
+    # Snapshot: epoch, game over, unit count, bullet count, fired bullets, bullet speed, range and delay
+    snapshotHeader = struct.Struct('<IBIIIddi')
+    # Snapshot of a unit: position, orientation, alive, weapon target, last bullet epoch
+    snapshotUnit = struct.Struct('<ddhBddi')
+
     @staticmethod
     def getInstance():
         if GameState._instance is None:
             GameState()
         return GameState._instance
 
+    @staticmethod
+    def resetInstance():
+        """
+        Replace the instance with a new one, e.g. to play several independent games in one process
+        """
+        GameState._instance = None
+        return GameState.getInstance()
+
     def __init__(self):
         if GameState._instance is not None:
             raise Exception("GameState class is a singleton. Use getInstance() method to get the instance.")
@@ -22,11 +44,21 @@ class GameState():
         self.worldSize = Vector2(16,10)
         self.running = True
         self.level = Level("empty level")
-        self.bullets = []
+        self.unitGrid = UnitGrid()
+        self.unitArrays = UnitArrays()
+        self.bullets = BulletStore()
         self.bulletSpeed = 0.1
         self.bulletRange = 4
         self.bulletDelay = 10
-        self.observers = []
+        self.unitMoveDelay = 30
+        self.flowField = FlowField()
+        self.lineOfSight = LineOfSight()
+        self.events = EventBus()
+        # Positions of the units moved during the last tick, by unit index, for the rendering
+        self.previousPositions = {}
+        # View on the world, only used when there is a window
+        self.camera = Camera()
+        self.unitsChanged()
         
 
         # Mode of the game
@@ -62,34 +94,119 @@ class GameState():
 
     def findUnit(self,position):
         """
-        Returns the index of the first unit at position, otherwise None.
+        Returns the first unit at position, otherwise None.
         """
-        for unit in self.level.units:
-            if  int(unit.position.x) == int(position.x) \
-            and int(unit.position.y) == int(position.y):
-                return unit
-        return None
+        return self.unitGrid.find(position)
     
     def findLiveUnit(self,position):
         """
-        Returns the index of the first live unit at position, otherwise None.
+        Returns the first live unit at position, otherwise None.
         """
-        unit = self.findUnit(position)
+        unit = self.unitGrid.find(position)
         if unit is None or unit.status != "alive":
             return None
         return unit
+
+    def findUnitsInRange(self,position,radius,aliveOnly=True):
+        """
+        Returns the units at most radius cells away from position
+        """
+        return self.unitGrid.findInRange(position,radius,aliveOnly)
+
+    def unitsChanged(self):
+        """
+        Must be called when level.units is replaced, to index the new units
+        """
+        for index,unit in enumerate(self.level.units):
+            unit.index = index
+        self.unitGrid.rebuild(self.level.units)
+        self.unitArrays.rebuild(self.level.units)
+        self.previousPositions.clear()
+
+    def moveUnit(self,unit,position):
+        """
+        Move a unit, keeping the unit grid and arrays up to date
+        """
+        if unit.index not in self.previousPositions:
+            self.previousPositions[unit.index] = unit.position
+        self.unitGrid.move(unit,position)
+        self.unitArrays.move(unit.index,position)
+
+    def setWeaponTarget(self,unit,target):
+        unit.weaponTarget = target
+        self.unitArrays.target[unit.index] = (target.x,target.y)
+
+    def unitFired(self,unit):
+        """
+        Start the reload delay of a unit that fired a bullet
+        """
+        unit.lastBulletEpoch = self.epoch
+        self.unitArrays.lastBulletEpoch[unit.index] = self.epoch
+
+    def interpolatedPosition(self,unit,alpha):
+        """
+        Returns the position of a unit between the previous tick (alpha = 0) and the current one (alpha = 1)
+        """
+        previous = self.previousPositions.get(unit.index)
+        if previous is None:
+            return unit.position
+        return previous.lerp(unit.position,alpha)
+
+    def destroyUnit(self,unit):
+        """
+        Destroy a unit and publish the event.
+        The wreck stays in the unit grid, as it still blocks its cell.
+        """
+        unit.status = "destroyed"
+        self.unitArrays.destroy(unit.index)
+        self.events.publish(UnitDestroyedEvent(unit))
     
-    def addObserver(self,observer):
+    def snapshot(self):
         """
-        Add a game state observer. 
-        All observer is notified when something happens (see GameStateObserver class)
+        Returns the state of the current level as a flat buffer: a header, the units and the bullets.
+        The static parts of the level (ground, walls, cell size) are not included.
         """
-        self.observers.append(observer)
-        
-    def notifyUnitDestroyed(self,unit):
-        for observer in self.observers:
-            observer.unitDestroyed(unit)
+        units = self.level.units
+        bullets = self.bullets
+        header = GameState.snapshotHeader
+        unitSize = GameState.snapshotUnit.size
+        buffer = bytearray(header.size + len(units) * unitSize)
+        header.pack_into(buffer,0,self.epoch,self.level.gameOver,len(units),bullets.count,bullets.fired,
+                         self.bulletSpeed,self.bulletRange,self.bulletDelay)
+        offset = header.size
+        pack = GameState.snapshotUnit.pack_into
+        for unit in units:
+            position = unit.position
+            target = unit.weaponTarget
+            pack(buffer,offset,position.x,position.y,unit.orientation,unit.status == "alive",
+                 target.x,target.y,unit.lastBulletEpoch)
+            offset += unitSize
+        return bytes(buffer) + bullets.snapshot()
 
-    def notifyBulletFired(self,unit):
-        for observer in self.observers:
-            observer.bulletFired(unit)
+    def restore(self,buffer):
+        """
+        Restore a snapshot. It must come from the level that is currently loaded.
+        """
+        epoch,gameOver,unitCount,bulletCount,fired,bulletSpeed,bulletRange,bulletDelay = \
+            GameState.snapshotHeader.unpack_from(buffer,0)
+        units = self.level.units
+        if unitCount != len(units):
+            raise RuntimeError("The snapshot has {} units, the level {}".format(unitCount,len(units)))
+        self.epoch = epoch
+        self.level.gameOver = bool(gameOver)
+        self.bulletSpeed = bulletSpeed
+        self.bulletRange = bulletRange
+        self.bulletDelay = bulletDelay
+        offset = GameState.snapshotHeader.size
+        unitSize = GameState.snapshotUnit.size
+        unpack = GameState.snapshotUnit.unpack_from
+        for unit in units:
+            x,y,orientation,alive,targetX,targetY,lastBulletEpoch = unpack(buffer,offset)
+            offset += unitSize
+            unit.position = Vector2(x,y)
+            unit.orientation = orientation
+            unit.status = "alive" if alive else "destroyed"
+            unit.weaponTarget = Vector2(targetX,targetY)
+            unit.lastBulletEpoch = lastBulletEpoch
+        self.unitsChanged()
+        self.bullets.restore(buffer,offset,bulletCount,fired)
@@ -1,13 +1,20 @@
 import json
+import numpy as np
 from pygame.math import Vector2
 from .Unit import Unit
+from .TileLayer import TileLayer
 
 
 class Level():
+    passableChunkSize = 64
+
     def __init__(self, name):
         self.name = name
-        self.ground = [ [ Vector2(5,1) ] * 16 ] * 10
-        self.walls = [ [ None ] * 16 ] * 10
+        self.ground = TileLayer.filled(16,10,Vector2(5,1))
+        self.walls = TileLayer.filled(16,10)
+        # Incremented each time the walls change
+        self.wallsVersion = 0
+        self.resetPassable()
         self.units = [ Unit(Vector2(8,9),Vector2(1,0)) ]
         self.cellSize = Vector2(64,64)
         self.gameOver = False
@@ -20,6 +27,92 @@ class Level():
     def cellHeight(self):
         return int(self.cellSize.y)
 
+    def setWalls(self,tiles):
+        """
+        Replace the walls layer tiles (see TileLayer.setTiles). The walls are not read here.
+        """
+        self.walls.setTiles(tiles)
+        self.wallsVersion += 1
+        self.resetPassable()
+
+    def resetPassable(self):
+        """
+        Forget the passable cells. They are computed from the walls by chunks of passableChunkSize cells,
+        the first time a cell of the chunk is tested, so the walls of a memory mapped level stay on disk.
+        """
+        height = self.walls.height
+        width = self.walls.width
+        size = Level.passableChunkSize
+        # Only the cells of the computed chunks are valid, the memory of the others is not touched
+        self.passableMask = np.empty((height,width),dtype=bool)
+        self.passableChunks = np.zeros(((height + size - 1) // size,(width + size - 1) // size),dtype=bool)
+
+    def computePassable(self,chunkYs,chunkXs):
+        """
+        Compute the passable cells of the chunks (chunkYs[i],chunkXs[i]) that are not computed yet
+        """
+        size = Level.passableChunkSize
+        chunks = self.passableChunks
+        ids = self.walls.ids
+        for chunkY,chunkX in zip(chunkYs,chunkXs):
+            if chunks[chunkY,chunkX]:
+                continue
+            rows = slice(chunkY * size,(chunkY + 1) * size)
+            columns = slice(chunkX * size,(chunkX + 1) * size)
+            np.equal(ids[rows,columns],TileLayer.noTile,out=self.passableMask[rows,columns])
+            chunks[chunkY,chunkX] = True
+
+    def isPassable(self,x,y):
+        """
+        Returns True if the cell (x,y) is inside the walls layer and has no wall
+        """
+        mask = self.passableMask
+        if not (0 <= y < mask.shape[0] and 0 <= x < mask.shape[1]):
+            return False
+        size = Level.passableChunkSize
+        if not self.passableChunks[y // size,x // size]:
+            self.computePassable((y // size,),(x // size,))
+        return bool(mask[y,x])
+
+    def passableCells(self,xs,ys):
+        """
+        Vectorized isPassable: returns a boolean array for arrays of cell coordinates
+        """
+        xs = np.asarray(xs,dtype=np.intp)
+        ys = np.asarray(ys,dtype=np.intp)
+        height,width = self.passableMask.shape
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        xs = xs[inside]
+        ys = ys[inside]
+        size = Level.passableChunkSize
+        chunkXs = xs // size
+        chunkYs = ys // size
+        missing = ~self.passableChunks[chunkYs,chunkXs]
+        if missing.any():
+            chunks = np.unique(np.stack((chunkYs[missing],chunkXs[missing])),axis=1)
+            self.computePassable(chunks[0].tolist(),chunks[1].tolist())
+        result = np.zeros(inside.shape,dtype=bool)
+        result[inside] = self.passableMask[ys,xs]
+        return result
+
+    def passableRegion(self,x0,y0,x1,y1):
+        """
+        Returns the passable cells from (x0,y0) to (x1,y1) excluded, as a boolean array.
+        Cells outside the walls layer are not passable.
+        """
+        region = np.zeros((max(0,y1-y0),max(0,x1-x0)),dtype=bool)
+        height,width = self.passableMask.shape
+        clipX0 = max(x0,0)
+        clipY0 = max(y0,0)
+        clipX1 = min(x1,width)
+        clipY1 = min(y1,height)
+        if clipX0 < clipX1 and clipY0 < clipY1:
+            size = Level.passableChunkSize
+            chunkYs,chunkXs = np.nonzero(~self.passableChunks[clipY0 // size:(clipY1 - 1) // size + 1,clipX0 // size:(clipX1 - 1) // size + 1])
+            self.computePassable((chunkYs + clipY0 // size).tolist(),(chunkXs + clipX0 // size).tolist())
+            region[clipY0-y0:clipY1-y0,clipX0-x0:clipX1-x0] = self.passableMask[clipY0:clipY1,clipX0:clipX1]
+        return region
+
     def __str__(self):
         return self.name
     
\ No newline at end of file
@@ -0,0 +1,61 @@
+import math
+
+
+class LineOfSight():
+    """
+    Tells if the segment between the centers of two cells crosses a wall (see Level.passableRegion).
+    Cells are visited with a grid traversal (Amanatides and Woo), and the results are cached
+    by (from cell, to cell) until the walls change.
+    """
+    def __init__(self,maxSize=100000):
+        self.cache = {}
+        self.maxSize = maxSize
+        self.wallsVersion = None
+
+    def isClear(self,state,source,target):
+        """
+        Returns True if there is no wall between the cells of source and target
+        """
+        level = state.level
+        if level.wallsVersion != self.wallsVersion:
+            self.cache.clear()
+            self.wallsVersion = level.wallsVersion
+        key = (int(source.x),int(source.y),int(target.x),int(target.y))
+        clear = self.cache.get(key)
+        if clear is None:
+            if len(self.cache) >= self.maxSize:
+                self.cache.clear()
+            # Only the cells of the rectangle between the two cells are read
+            fromX,fromY,toX,toY = key
+            x0 = min(fromX,toX)
+            y0 = min(fromY,toY)
+            passable = level.passableRegion(x0,y0,max(fromX,toX) + 1,max(fromY,toY) + 1)
+            clear = self.traverse(passable,fromX - x0,fromY - y0,toX - x0,toY - y0)
+            self.cache[key] = clear
+        return clear
+
+    @staticmethod
+    def traverse(passable,cellX,cellY,endX,endY):
+        """
+        Returns True if no cell between (cellX,cellY) and (endX,endY) is a wall
+        """
+        dx = endX - cellX
+        dy = endY - cellY
+        stepX = (dx > 0) - (dx < 0)
+        stepY = (dy > 0) - (dy < 0)
+        # Parametric distance (0 to 1 along the segment) to cross one cell, and to the next cell border
+        deltaX = 1 / abs(dx) if dx != 0 else math.inf
+        deltaY = 1 / abs(dy) if dy != 0 else math.inf
+        maxX = deltaX / 2
+        maxY = deltaY / 2
+        while True:
+            if maxX < maxY:
+                cellX += stepX
+                maxX += deltaX
+            else:
+                cellY += stepY
+                maxY += deltaY
+            if cellX == endX and cellY == endY:
+                return True
+            if not passable[cellY,cellX]:
+                return False
@@ -0,0 +1,85 @@
+import numpy as np
+from pygame.math import Vector2
+
+
+class TileLayer():
+    """
+    Tiles of a level layer, as a (height,width) uint16 array of tile ids: tile x + 256 * tile y,
+    or noTile for empty cells. This is the layout of the (tile x, tile y) uint8 pairs of compiled levels,
+    so their memory mapped tiles are used as they are: only the cells that are read are loaded.
+    """
+    noTile = 0xFFFF
+
+    def __init__(self,tiles):
+        self.ids = None
+        # Shared Vector2 of each tile id
+        self.vectors = {}
+        self.setTiles(tiles)
+
+    @staticmethod
+    def filled(width,height,tile=None):
+        """
+        Returns a layer in memory with the same tile in all cells, or no tile
+        """
+        ids = np.full((height,width),TileLayer.noTile,dtype=np.uint16)
+        if tile is not None:
+            ids[:,:] = TileLayer.tileId(int(tile.x),int(tile.y))
+        return TileLayer(ids)
+
+    @staticmethod
+    def tileId(tileX,tileY):
+        return tileX + 256 * tileY
+
+    def setTiles(self,tiles):
+        """
+        Replace the content of the layer, keeping the layer object shared by its users.
+        tiles is either an array of tile ids, or a (height,width,2) array of uint8 tile coordinates.
+        """
+        if tiles.ndim == 3:
+            tiles = tiles.view('<u2').reshape(tiles.shape[:2])
+        self.ids = tiles
+
+    @property
+    def width(self):
+        return self.ids.shape[1]
+
+    @property
+    def height(self):
+        return self.ids.shape[0]
+
+    def vector(self,tileId):
+        """
+        Returns the tile coordinates of a tile id as a Vector2, shared by all the cells with this tile
+        """
+        vector = self.vectors.get(tileId)
+        if vector is None:
+            vector = Vector2(tileId & 0xFF,tileId >> 8)
+            self.vectors[tileId] = vector
+        return vector
+
+    def tile(self,x,y):
+        """
+        Returns the tile of a cell as a Vector2, or None if the cell is empty or outside the layer
+        """
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return None
+        tileId = int(self.ids[y,x])
+        if tileId == TileLayer.noTile:
+            return None
+        return self.vector(tileId)
+
+    def region(self,x0,y0,x1,y1):
+        """
+        Returns the tile ids of the cells from (x0,y0) to (x1,y1) excluded, clipped to the layer
+        """
+        return self.ids[max(0,y0):max(0,y1),max(0,x0):max(0,x1)]
+
+    def occupied(self,x0=0,y0=0,x1=None,y1=None):
+        """
+        Returns the cells with a tile in a region (the whole layer by default), as a boolean array
+        """
+        if x1 is None:
+            x1 = self.width
+        if y1 is None:
+            y1 = self.height
+        return self.region(x0,y0,x1,y1) != TileLayer.noTile
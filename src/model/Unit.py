@@ -3,7 +3,13 @@ from .GameItem import GameItem
 from pygame.math import Vector2
 
 class Unit(GameItem):
+    __slots__ = ('weaponTarget','lastBulletEpoch','index','mobile')
+
     def __init__(self,position,tile):
         super().__init__(position,tile)
         self.weaponTarget = Vector2(0,0)
-        self.lastBulletEpoch = -100
\ No newline at end of file
+        self.lastBulletEpoch = -100
+        # Index of the unit in level.units (see GameState.unitsChanged)
+        self.index = 0
+        # Mobile enemies follow the flow field towards the player's unit
+        self.mobile = False
\ No newline at end of file
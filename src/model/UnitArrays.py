@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class UnitArrays():
+    """
+    Array copies of the unit fields read by the enemies decisions, by unit index (see GameState.unitsChanged):
+    positions, weapon targets, last bullet epochs and alive flags, and the number of live units.
+    The game state keeps them up to date (moveUnit, setWeaponTarget, unitFired, destroyUnit).
+    """
+    def __init__(self):
+        # Incremented each time a unit moves or is destroyed, or the units are replaced
+        self.cellsVersion = 0
+        self.rebuild([])
+
+    def rebuild(self,units):
+        """
+        Copy the fields of all the units of a list
+        """
+        count = len(units)
+        self.count = count
+        self.position = np.array([ (unit.position.x,unit.position.y) for unit in units ],dtype=np.float64).reshape(count,2)
+        self.target = np.array([ (unit.weaponTarget.x,unit.weaponTarget.y) for unit in units ],dtype=np.float64).reshape(count,2)
+        self.lastBulletEpoch = np.array([ unit.lastBulletEpoch for unit in units ],dtype=np.int64)
+        self.alive = np.array([ unit.status == "alive" for unit in units ],dtype=bool)
+        self.aliveCount = int(self.alive.sum())
+        self.cellsVersion += 1
+
+    def move(self,index,position):
+        self.position[index] = (position.x,position.y)
+        self.cellsVersion += 1
+
+    def destroy(self,index):
+        if self.alive[index]:
+            self.alive[index] = False
+            self.aliveCount -= 1
+            self.cellsVersion += 1
+
+    def readyToShoot(self,epoch,bulletDelay):
+        """
+        Returns the mask of the units whose last bullet is at least bulletDelay epochs old
+        """
+        return self.lastBulletEpoch <= epoch - bulletDelay
+
+    def notTargeting(self,target):
+        """
+        Returns the mask of the units whose weapon target is not target
+        """
+        return (self.target != (target.x,target.y)).any(axis=1)
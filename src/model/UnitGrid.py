@@ -0,0 +1,98 @@
+import math
+
+
+class UnitGrid():
+    """
+    Spatial hash of the units: each cell (x,y) maps to the list of units it contains.
+    Destroyed units stay in the grid, as they still block the cell.
+    """
+    def __init__(self):
+        self.cells = {}
+        self.count = 0
+
+    @staticmethod
+    def cellOf(position):
+        """
+        Returns the cell key of a position
+        """
+        return (int(position.x), int(position.y))
+
+    def clear(self):
+        self.cells.clear()
+        self.count = 0
+
+    def rebuild(self,units):
+        """
+        Index all the units of a list
+        """
+        self.clear()
+        for unit in units:
+            self.add(unit)
+
+    def add(self,unit):
+        cell = self.cellOf(unit.position)
+        units = self.cells.get(cell)
+        if units is None:
+            self.cells[cell] = [unit]
+        else:
+            units.append(unit)
+        self.count += 1
+
+    def remove(self,unit):
+        cell = self.cellOf(unit.position)
+        units = self.cells.get(cell)
+        if units is None:
+            return
+        units.remove(unit)
+        self.count -= 1
+        if len(units) == 0:
+            del self.cells[cell]
+
+    def move(self,unit,position):
+        """
+        Change the position of a unit, and update its cell if needed
+        """
+        if self.cellOf(unit.position) != self.cellOf(position):
+            self.remove(unit)
+            unit.position = position
+            self.add(unit)
+        else:
+            unit.position = position
+
+    def find(self,position):
+        """
+        Returns the first unit in the cell of position, otherwise None.
+        """
+        units = self.cells.get(self.cellOf(position))
+        if units is None:
+            return None
+        return units[0]
+
+    def findInRange(self,position,radius,aliveOnly=True):
+        """
+        Returns the units whose position is at most radius away from position
+        """
+        result = []
+        radiusSquared = radius * radius
+        minX = math.floor(position.x - radius)
+        maxX = math.ceil(position.x + radius)
+        minY = math.floor(position.y - radius)
+        maxY = math.ceil(position.y + radius)
+        cells = self.cells
+        # When the range covers more cells than there are units, scanning the units is cheaper
+        if (maxX - minX + 1) * (maxY - minY + 1) > self.count:
+            candidates = cells.values()
+        else:
+            candidates = []
+            for y in range(minY,maxY+1):
+                for x in range(minX,maxX+1):
+                    units = cells.get((x,y))
+                    if units is not None:
+                        candidates.append(units)
+        for units in candidates:
+            for unit in units:
+                if aliveOnly and unit.status != "alive":
+                    continue
+                if unit.position.distance_squared_to(position) <= radiusSquared:
+                    result.append(unit)
+        return result
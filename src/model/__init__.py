@@ -1,7 +1,14 @@
 from .GameItem import GameItem
 from .GameState import GameState
-from .observer import GameStateObserver
+from .events import Event, UnitDestroyedEvent, LevelLoadedEvent, BulletFiredEvent
+from .EventBus import EventBus
 from .Unit import Unit
-from .Bullet import Bullet
 from .Level import Level
-from .Menu import Menu
\ No newline at end of file
+from .Menu import Menu
+from .UnitGrid import UnitGrid
+from .UnitArrays import UnitArrays
+from .BulletStore import BulletStore
+from .FlowField import FlowField
+from .LineOfSight import LineOfSight
+from .Camera import Camera
+from .TileLayer import TileLayer
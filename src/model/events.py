@@ -0,0 +1,26 @@
+class Event():
+    """
+    Base class of the game state events (see EventBus).
+    When coalesce is True, only the last event of its type queued during a tick is delivered.
+    """
+    __slots__ = ()
+    coalesce = False
+
+
+class UnitDestroyedEvent(Event):
+    __slots__ = ('unit',)
+
+    def __init__(self,unit):
+        self.unit = unit
+
+
+class LevelLoadedEvent(Event):
+    __slots__ = ()
+    coalesce = True
+
+
+class BulletFiredEvent(Event):
+    __slots__ = ('unit',)
+
+    def __init__(self,unit):
+        self.unit = unit
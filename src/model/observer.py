@@ -1,8 +0,0 @@
-            
-class GameStateObserver():
-    """
-    Observer class for monitoring game state changes.
-    """
-
-    def unitDestroyed(self, unit):
-        pass
\ No newline at end of file
@@ -0,0 +1,30 @@
+import argparse
+import glob
+import time
+from controller.sweep import sweepTasks, runSweep
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Play many headless games on all cores to balance the levels")
+    parser.add_argument('--levels', nargs='+', default=None, help="level files (default: levels/*.json)")
+    parser.add_argument('--bullet-speed', nargs='+', type=float, default=[0.1])
+    parser.add_argument('--bullet-range', nargs='+', type=float, default=[4])
+    parser.add_argument('--bullet-delay', nargs='+', type=int, default=[10])
+    parser.add_argument('--placements', type=int, default=1, help="number of unit placements, the first one is the level's")
+    parser.add_argument('--seeds', type=int, default=10, help="number of seeded random players per configuration")
+    parser.add_argument('--ticks', type=int, default=10000, help="maximum number of ticks per game")
+    parser.add_argument('--workers', type=int, default=None, help="number of processes (default: all cores)")
+    parser.add_argument('--results', default="sweep_results.csv", help="csv file with one row per game")
+    parser.add_argument('--summary', default="sweep_summary.csv", help="csv file with one row per configuration")
+    args = parser.parse_args()
+
+    levels = args.levels or sorted(glob.glob("levels/*.json"))
+    tasks = sweepTasks(levels,args.bullet_speed,args.bullet_range,args.bullet_delay,args.placements,args.seeds,args.ticks)
+    startTime = time.perf_counter()
+    summary = runSweep(tasks,args.results,args.workers)
+    summary.save(args.summary)
+    games = sum(stats['games'] for stats in summary.configurations.values())
+    elapsed = time.perf_counter() - startTime
+    print("{} games in {:.1f}s ({:.1f} games/s), results in {} and {}".format(
+        games,elapsed,games / elapsed,args.results,args.summary
+    ))
@@ -1,2 +1,3 @@
 from .layer import Layer, ArrayLayer, UnitsLayer, BulletsLayer, ExplosionsLayer
-from .user_interface import UserInterface
\ No newline at end of file
+from .user_interface import UserInterface
+from .assets import AssetRegistry
\ No newline at end of file
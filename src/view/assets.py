@@ -0,0 +1,134 @@
+import io
+import pygame
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AssetRegistry():
+    """
+    Process wide cache of the images and fonts: each file is decoded once,
+    and all the layers share the same surfaces.
+    Files can be preloaded on background threads: getImage and getFont wait for them if needed.
+    Fonts are only read on those threads, and opened on the main thread: the font library is not thread safe.
+    """
+    _instance = None
+
+    @staticmethod
+    def getInstance():
+        if AssetRegistry._instance is None:
+            AssetRegistry()
+        return AssetRegistry._instance
+
+    def __init__(self):
+        if AssetRegistry._instance is not None:
+            raise Exception("AssetRegistry class is a singleton. Use getInstance() method to get the instance.")
+        AssetRegistry._instance = self
+
+        # (fileName, alpha) -> surface
+        self.images = {}
+        # Images decoded before the display was created, converted on their next use
+        self.unconverted = set()
+        # (fileName, size) -> font
+        self.fonts = {}
+
+        # Background loading: futures of the images and fonts not used yet, and the loading times
+        self.executor = None
+        self.pendingImages = {}
+        self.pendingFonts = {}
+        self.loadTimes = {}
+        self.lastLoadTime = None
+
+    def submit(self,name,function,*args):
+        """
+        Run a loading function on the thread pool, timing it under name
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=4,thread_name_prefix='assets')
+        def load():
+            startTime = time.perf_counter()
+            result = function(*args)
+            self.lastLoadTime = time.perf_counter()
+            self.loadTimes[name] = self.lastLoadTime - startTime
+            return result
+        return self.executor.submit(load)
+
+    def preloadImage(self,fileName,alpha=True):
+        key = (fileName,alpha)
+        if key not in self.images and key not in self.pendingImages:
+            self.pendingImages[key] = self.submit(fileName,pygame.image.load,fileName)
+
+    def preloadFont(self,fileName,size):
+        """
+        Read a font file in the background. The default font (fileName None) is opened on its first use.
+        """
+        key = (fileName,size)
+        if fileName is not None and key not in self.fonts and key not in self.pendingFonts:
+            self.pendingFonts[key] = self.submit("{} {}".format(fileName,size),self.readFont,fileName)
+
+    @staticmethod
+    def readFont(fileName):
+        with open(fileName,'rb') as file:
+            return file.read()
+
+    def isReady(self):
+        """
+        Returns True when no preloading is running
+        """
+        return all(future.done() for future in self.pendingImages.values()) \
+           and all(future.done() for future in self.pendingFonts.values())
+
+    def waitReady(self):
+        """
+        Wait for all the preloaded files, and add them to the cache
+        """
+        for key in list(self.pendingImages):
+            self.getImage(*key)
+        for key in list(self.pendingFonts):
+            self.getFont(*key)
+
+    def getImage(self,fileName,alpha=True):
+        """
+        Returns the image in fileName, converted to the display format when there is a display
+        """
+        key = (fileName,alpha)
+        image = self.images.get(key)
+        if image is None:
+            future = self.pendingImages.pop(key,None)
+            image = future.result() if future is not None else pygame.image.load(fileName)
+            self.unconverted.add(key)
+        if key in self.unconverted and pygame.display.get_surface() is not None:
+            image = image.convert_alpha() if alpha else image.convert()
+            self.unconverted.discard(key)
+        self.images[key] = image
+        return image
+
+    def getFont(self,fileName,size):
+        key = (fileName,size)
+        font = self.fonts.get(key)
+        if font is None:
+            future = self.pendingFonts.pop(key,None)
+            font = pygame.font.Font(io.BytesIO(future.result()),size) if future is not None else pygame.font.Font(fileName,size)
+            self.fonts[key] = font
+        return font
+
+    def memoryUsage(self):
+        """
+        Returns the number of bytes used by the pixels of the cached images
+        """
+        return sum(image.get_pitch() * image.get_height() for image in self.images.values())
+
+    def evict(self,fileName=None):
+        """
+        Remove an image (all of them if fileName is None) from the cache.
+        The surfaces already handed out stay valid.
+        """
+        if fileName is None:
+            self.images.clear()
+            self.unconverted.clear()
+            self.pendingImages.clear()
+            return
+        for key in [ key for key in self.images if key[0] == fileName ]:
+            del self.images[key]
+            self.unconverted.discard(key)
+        for key in [ key for key in self.pendingImages if key[0] == fileName ]:
+            del self.pendingImages[key]
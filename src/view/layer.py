@@ -1,17 +1,47 @@
 import pygame
 import math
-from model import GameStateObserver
+import numpy as np
+from collections import OrderedDict
+from model import LevelLoadedEvent, UnitDestroyedEvent
 from pygame.math import Vector2
 from pygame.rect import Rect
+from .assets import AssetRegistry
+
+class Layer():
+    # Static layers are only rendered when the background is baked (see UserInterface.renderLevelDirty)
+    static = False
+    # Moving items are drawn between their previous (0) and current (1) tick positions
+    interpolation = 1.0
 
-class Layer(GameStateObserver):
     def __init__(self,cellSize,imageFile):
         self.cellSize = cellSize
-        self.texture = pygame.image.load(imageFile)
+        # The texture is only needed for the first render, it can still be loading in the background
+        self.imageFile = imageFile
+        self.textureImage = None
+        # Rotated tiles, keyed by (tile x, tile y, quantized angle), least recently used first
+        self.rotationCache = OrderedDict()
+        self.angleStep = 1
+        self.rotationCacheSize = 1024
         
     def setTileset(self,cellSize,imageFile):
         self.cellSize = cellSize
-        self.texture = pygame.image.load(imageFile)
+        self.imageFile = imageFile
+        self.textureImage = None
+        self.rotationCache.clear()
+
+    @property
+    def texture(self):
+        if self.textureImage is None:
+            self.textureImage = AssetRegistry.getInstance().getImage(self.imageFile)
+        return self.textureImage
+
+    def setRotationCache(self,angleStep,cacheSize):
+        """
+        Angles are rounded to a multiple of angleStep degrees, and at most cacheSize rotated tiles are kept
+        """
+        self.angleStep = angleStep
+        self.rotationCacheSize = cacheSize
+        self.rotationCache.clear()
 
     @property
     def cellWidth(self):
@@ -21,70 +51,180 @@ class Layer(GameStateObserver):
     def cellHeight(self):
         return int(self.cellSize.y)        
     
-    def unitDestroyed(self,unit):
+    def subscribe(self,events):
+        """
+        Subscribe to the game state events the layer handles (see EventBus)
+        """
         pass
         
-    def renderTile(self,surface,position,tile,angle=None):
-        # Location on screen
+    def rotatedTile(self,textureRect,angle):
+        """
+        Returns the rotated tile and the offsets to keep it centered on its cell
+        """
+        step = self.angleStep
+        angle = (round(angle / step) * step) % 360
+        key = (textureRect.x,textureRect.y,angle)
+        cache = self.rotationCache
+        entry = cache.get(key)
+        if entry is not None:
+            cache.move_to_end(key)
+            return entry
+
+        # Extract the tile in a surface
+        textureTile = pygame.Surface((self.cellWidth,self.cellHeight),pygame.SRCALPHA)
+        textureTile.blit(self.texture,(0,0),textureRect)
+        # Rotate the surface with the tile
+        rotatedTile = pygame.transform.rotate(textureTile,angle)
+        # We rotate around the center of the tile
+        offsetX = (rotatedTile.get_width() - textureTile.get_width()) // 2
+        offsetY = (rotatedTile.get_height() - textureTile.get_height()) // 2
+
+        entry = (rotatedTile,offsetX,offsetY)
+        cache[key] = entry
+        if len(cache) > self.rotationCacheSize:
+            cache.popitem(last=False)
+        return entry
+
+    def renderTile(self,surface,position,tile,angle=None,origin=None):
+        # Location on screen, origin is the world pixel at the top left corner of surface
         spritePoint = position.elementwise()*self.cellSize
+        if origin is not None:
+            spritePoint -= origin
         
         # Texture
         texturePoint = tile.elementwise()*self.cellSize
         textureRect = Rect(int(texturePoint.x), int(texturePoint.y), self.cellWidth, self.cellHeight)
         
-        # Draw
+        # Draw, and return the changed area of the surface
         if angle is None:
-            surface.blit(self.texture,spritePoint,textureRect)
+            return surface.blit(self.texture,spritePoint,textureRect)
         else:
-            # Extract the tile in a surface
-            textureTile = pygame.Surface((self.cellWidth,self.cellHeight),pygame.SRCALPHA)
-            textureTile.blit(self.texture,(0,0),textureRect)
-            # Rotate the surface with the tile
-            rotatedTile = pygame.transform.rotate(textureTile,angle)
+            rotatedTile,offsetX,offsetY = self.rotatedTile(textureRect,angle)
             # Compute the new coordinate on the screen, knowing that we rotate around the center of the tile
-            spritePoint.x -= (rotatedTile.get_width() - textureTile.get_width()) // 2
-            spritePoint.y -= (rotatedTile.get_height() - textureTile.get_height()) // 2
+            spritePoint.x -= offsetX
+            spritePoint.y -= offsetY
             # Render the rotatedTile
-            surface.blit(rotatedTile,spritePoint)
+            return surface.blit(rotatedTile,spritePoint)
 
     def render(self,surface):
+        """
+        Render the layer, and returns the list of rectangles that changed in surface
+        """
         raise NotImplementedError() 
     
 class ArrayLayer(Layer):
-    def __init__(self,ui,imageFile,gameState,array,surfaceFlags=pygame.SRCALPHA):
+    """
+    Tiles of a level layer (see TileLayer), baked in chunks of chunkSize x chunkSize cells.
+    Chunks are baked when they are first visible, and at most maxChunks are kept (least recently used first).
+    """
+    # The content only changes when a level is loaded
+    static = True
+
+    def __init__(self,ui,imageFile,gameState,array,surfaceFlags=pygame.SRCALPHA,chunkSize=16,maxChunks=12):
         super().__init__(ui,imageFile)
         self.gameState = gameState
         self.array = array
-        self.surface = None
         self.surfaceFlags = surfaceFlags
+        self.chunkSize = chunkSize
+        self.maxChunks = maxChunks
+        # Chunk surfaces, keyed by (chunk x, chunk y)
+        self.chunks = OrderedDict()
     
     def setTileset(self,cellSize,imageFile):
         super().setTileset(cellSize,imageFile)
-        self.surface = None
-        
+        self.chunks.clear()
+
+    def subscribe(self,events):
+        events.subscribe(LevelLoadedEvent,self.levelLoaded)
+
+    def levelLoaded(self,events=()):
+        self.chunks.clear()
+
+    def bakeChunk(self,chunkX,chunkY):
+        size = self.chunkSize
+        surface = pygame.Surface((size * self.cellWidth,size * self.cellHeight),flags=self.surfaceFlags)
+        # Only the tiles of the chunk are read from the layer
+        startX = chunkX * size
+        startY = chunkY * size
+        layer = self.array
+        ids = layer.region(startX,startY,startX + size,startY + size)
+        noTile = layer.noTile
+        for y,row in enumerate(ids.tolist()):
+            for x,tileId in enumerate(row):
+                if tileId != noTile:
+                    self.renderTile(surface,Vector2(x,y),layer.vector(tileId))
+        return surface
+
+    def chunk(self,chunkX,chunkY,keep):
+        """
+        Returns a chunk surface, baked if needed. At least keep chunks stay in the cache.
+        """
+        key = (chunkX,chunkY)
+        chunks = self.chunks
+        surface = chunks.get(key)
+        if surface is not None:
+            chunks.move_to_end(key)
+            return surface
+        surface = self.bakeChunk(chunkX,chunkY)
+        chunks[key] = surface
+        while len(chunks) > max(self.maxChunks,keep):
+            chunks.popitem(last=False)
+        return surface
+
     def render(self,surface):
-        if self.surface is None:
-            self.surface = pygame.Surface(surface.get_size(),flags=self.surfaceFlags)
-            for y in range(self.gameState.worldHeight):
-                for x in range(self.gameState.worldWidth):
-                    tile = self.array[y][x]
-                    if not tile is None:
-                        self.renderTile(self.surface,Vector2(x,y),tile)
-        surface.blit(self.surface,(0,0))
+        state = self.gameState
+        camera = state.camera
+        chunkWidth = self.chunkSize * self.cellWidth
+        chunkHeight = self.chunkSize * self.cellHeight
+        width,height = surface.get_size()
+        # Visible chunks, inside the world
+        lastX = min((camera.x + width - 1) // chunkWidth,(state.worldWidth - 1) // self.chunkSize)
+        lastY = min((camera.y + height - 1) // chunkHeight,(state.worldHeight - 1) // self.chunkSize)
+        firstX = max(0,camera.x // chunkWidth)
+        firstY = max(0,camera.y // chunkHeight)
+        visible = (lastX - firstX + 1) * (lastY - firstY + 1)
+        rects = []
+        for chunkY in range(firstY,lastY + 1):
+            for chunkX in range(firstX,lastX + 1):
+                chunk = self.chunk(chunkX,chunkY,visible)
+                rects.append(surface.blit(chunk,(chunkX * chunkWidth - camera.x,chunkY * chunkHeight - camera.y)))
+        return rects
 
 class UnitsLayer(Layer):
     def __init__(self,ui,imageFile,gameState,units):
         super().__init__(ui,imageFile)
         self.gameState = gameState
         self.units = units
+
+    def visibleUnits(self):
+        """
+        Returns the units in the cells visible from the camera, in the order of the units list
+        """
+        state = self.gameState
+        x0,y0,x1,y1 = state.camera.visibleCells(self.cellWidth,self.cellHeight)
+        cells = state.unitGrid.cells
+        if (x1 - x0) * (y1 - y0) < len(cells):
+            units = []
+            for y in range(y0,y1):
+                for x in range(x0,x1):
+                    units.extend(cells.get((x,y),()))
+            units.sort(key=lambda unit: unit.index)
+            return units
+        return [ unit for unit in self.units if x0 <= unit.position.x < x1 and y0 <= unit.position.y < y1 ]
         
     def render(self,surface):
-        for unit in self.units:
-            self.renderTile(surface,unit.position,unit.tile,unit.orientation)
+        rects = []
+        state = self.gameState
+        origin = state.camera.origin
+        alpha = self.interpolation
+        for unit in self.visibleUnits():
+            position = state.interpolatedPosition(unit,alpha)
+            rects.append(self.renderTile(surface,position,unit.tile,unit.orientation,origin))
             if unit.status == "alive":
                 size = unit.weaponTarget - unit.position
                 angle = math.atan2(-size.x,-size.y) * 180 / math.pi
-                self.renderTile(surface,unit.position,Vector2(0,6),angle)
+                rects.append(self.renderTile(surface,position,Vector2(0,6),angle,origin))
+        return rects
                 
 class BulletsLayer(Layer):
     def __init__(self,ui,imageFile,gameState,bullets):
@@ -93,30 +233,95 @@ class BulletsLayer(Layer):
         self.bullets = bullets
         
     def render(self,surface):
-        for bullet in self.bullets:
-            if bullet.status == "alive":
-                self.renderTile(surface,bullet.position,bullet.tile,bullet.orientation)
+        bullets = self.bullets
+        count = bullets.count
+        position = bullets.position[:count]
+        if self.interpolation < 1:
+            # Bullets go back along their direction, by the distance of the last tick (or less for new ones)
+            direction = bullets.direction[:count]
+            travelled = ((position - bullets.start[:count]) * direction).sum(axis=1)
+            back = np.minimum(travelled,self.gameState.bulletSpeed) * (1 - self.interpolation)
+            position = position - back[:,None] * direction
+        camera = self.gameState.camera
+        x0,y0,x1,y1 = camera.visibleCells(self.cellWidth,self.cellHeight)
+        visible = (position[:,0] >= x0) & (position[:,0] < x1) & (position[:,1] >= y0) & (position[:,1] < y1)
+        origin = camera.origin
+        return [ self.renderTile(surface,Vector2(x,y),bullets.tile,None,origin) for x,y in position[visible].tolist() ]
                 
 class ExplosionsLayer(Layer):
-    def __init__(self,ui,imageFile):
+    """
+    Explosions in a pool of fixed capacity, stored as arrays.
+    The animation advances with the epochs of the game state, not with the rendered frames.
+    """
+    frameCount = 27
+    ticksPerFrame = 2
+    # Row of the animation in the tileset
+    row = 4
+
+    def __init__(self,ui,imageFile,gameState,capacity=512):
         super().__init__(ui,imageFile)
-        self.explosions = []
-        self.maxFrameIndex = 27
-        
+        self.gameState = gameState
+        self.count = 0
+        self.position = np.zeros((capacity,2),dtype=np.int32)
+        self.start = np.zeros(capacity,dtype=np.int64)
+        self.frameRects = []
+        self.computeFrameRects()
+
+    def computeFrameRects(self):
+        self.frameRects = [
+            Rect(frame * self.cellWidth,self.row * self.cellHeight,self.cellWidth,self.cellHeight)
+            for frame in range(self.frameCount)
+        ]
+
+    def setTileset(self,cellSize,imageFile):
+        super().setTileset(cellSize,imageFile)
+        self.computeFrameRects()
+
+    @property
+    def capacity(self):
+        return len(self.start)
+
     def add(self,position):
-        self.explosions.append({
-            'position': position,
-            'frameIndex': 0
-        })
+        """
+        Start an explosion on a cell. When the pool is full, the oldest explosion is replaced.
+        """
+        if self.count < self.capacity:
+            index = self.count
+            self.count += 1
+        else:
+            index = int(np.argmin(self.start))
+        self.position[index] = (int(position.x),int(position.y))
+        self.start[index] = self.gameState.epoch
+
+    def subscribe(self,events):
+        events.subscribe(LevelLoadedEvent,self.levelLoaded)
+        events.subscribe(UnitDestroyedEvent,self.unitsDestroyed)
+
+    def unitsDestroyed(self,events):
+        for event in events:
+            self.add(event.unit.position)
+
+    def levelLoaded(self,events=()):
+        self.count = 0
 
-    def unitDestroyed(self,unit):
-        self.add(unit.position)
-        
     def render(self,surface):
-        for explosion in self.explosions:
-            frameIndex = math.floor(explosion['frameIndex'])
-            self.renderTile(surface,explosion['position'],Vector2(frameIndex,4))
-            explosion['frameIndex'] += 0.5
-        self.explosions = [ explosion for explosion in self.explosions if explosion['frameIndex'] < self.maxFrameIndex ]
-            
-      
\ No newline at end of file
+        count = self.count
+        if count == 0:
+            return []
+        frames = (self.gameState.epoch - self.start[:count]) // self.ticksPerFrame
+        # Finished explosions are removed, keeping the order of the others
+        playing = (frames >= 0) & (frames < self.frameCount)
+        if not playing.all():
+            count = int(np.count_nonzero(playing))
+            self.position[:count] = self.position[:self.count][playing]
+            self.start[:count] = self.start[:self.count][playing]
+            frames = frames[playing]
+            self.count = count
+        camera = self.gameState.camera
+        x0,y0,x1,y1 = camera.visibleCells(self.cellWidth,self.cellHeight)
+        position = self.position[:count]
+        visible = (position[:,0] >= x0) & (position[:,0] < x1) & (position[:,1] >= y0) & (position[:,1] < y1)
+        points = (position[visible] * (self.cellWidth,self.cellHeight) - (camera.x,camera.y)).tolist()
+        texture = self.texture
+        frameRects = self.frameRects
+        return surface.blits([ (texture,point,frameRects[frame]) for point,frame in zip(points,frames[visible].tolist()) ])
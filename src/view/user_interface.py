@@ -1,34 +1,35 @@
+import os
 import pygame
+import time
 from model import GameState
 from pygame.math import Vector2
 from .layer import Layer, ArrayLayer, UnitsLayer, BulletsLayer, ExplosionsLayer
-from controller import MoveCommand, TargetCommand, ShootCommand, MoveBulletCommand, DeleteDestroyedCommand,Command,GameController
+from .assets import AssetRegistry
+from controller import GameController
 
 
 class UserInterface():
-    
-    def __init__(self):
+    def __init__(self,dirtyRendering=True,profiler=None,frameRate=60):
         self.controller = GameController()
+        self.controller.profiler = profiler
+        self.profiler = profiler
 
-        pygame.init()
+        # Only the modules used by the game are initialized
+        pygame.display.init()
+        pygame.font.init()
         self.window = pygame.display.set_mode((1280, 720))
         pygame.display.set_caption("Tower Defense")
-        pygame.display.set_icon(pygame.image.load("assets/icon.png"))
+        assets = AssetRegistry.getInstance()
+        pygame.display.set_icon(assets.getImage("assets/icon.png"))
         # Game state
         self.gameState = GameState.getInstance()
+        self.gameState.camera.setViewport(*self.window.get_size())
 
-        # Font
-        self.titleFont = pygame.font.Font("assets/BD_Cartoon_Shout.ttf", 72)
-        self.itemFont = pygame.font.Font("assets/BD_Cartoon_Shout.ttf", 48)
-        self.messageFont = pygame.font.Font("assets/BD_Cartoon_Shout.ttf", 36)
-
-
-        # Menu
-        self.menuCursor = pygame.image.load("assets/cursor.png")
-        for item in self.gameState.menu.menuItems:
-            surface = self.itemFont.render(item['title'], True, (200, 0, 0))
-            self.menuWidth = max(self.gameState.menu.menuWidth, surface.get_width())
-            item['surface'] = surface     
+        # Fonts and images are loaded in the background, the fonts of the menu first
+        assets.preloadFont("assets/BD_Cartoon_Shout.ttf", 72)
+        assets.preloadFont("assets/BD_Cartoon_Shout.ttf", 48)
+        assets.preloadImage("assets/cursor.png")
+        assets.preloadFont("assets/BD_Cartoon_Shout.ttf", 36)
 
         # Layers
         self.layers = [
@@ -36,54 +37,226 @@ class UserInterface():
             ArrayLayer(self.gameState.level.cellSize,"assets/walls.png",self.gameState,self.gameState.level.walls),
             UnitsLayer(self.gameState.level.cellSize,"assets/units.png",self.gameState,self.gameState.level.units),
             BulletsLayer(self.gameState.level.cellSize,"assets/explosions.png",self.gameState,self.gameState.bullets),
-            ExplosionsLayer(self.gameState.level.cellSize,"assets/explosions.png"),
+            ExplosionsLayer(self.gameState.level.cellSize,"assets/explosions.png",self.gameState),
         ]   
 
         for layer in self.layers:
-            self.gameState.addObserver(layer)
+            layer.subscribe(self.gameState.events)
+            assets.preloadImage(layer.imageFile)
+        # The levels of the menu are compiled in the background too, and Play waits for all assets
+        self.controller.preloadLevels()
+        self.controller.assetsBarrier = assets.waitReady
+
+        # Fixed timestep: the game runs tickRate ticks per second whatever the frame rate,
+        # and at most maxTicksPerFrame ticks in a frame
+        self.tickRate = 60
+        self.maxTicksPerFrame = 5
+        self.frameRate = frameRate
+        self.accumulator = 0.0
+        self.lastFrameTime = None
+        self.interpolation = 1.0
+
+        # Startup timing report: list of (phase, seconds), completed and printed once everything is loaded
+        self.startupTimes = None
+        self.startupStartTime = None
         
+        # Dirty rectangles rendering: static layers are baked in a background,
+        # and only the areas changed by the other layers are restored and updated
+        self.dirtyRendering = dirtyRendering
+        self.background = None
+        self.dirtyRects = []
+
+        # Menu and message overlays, composed again only when they change.
+        # menuBackground is the darkened game behind the menu, and overlayDrawn tells if the
+        # overlay of the current mode is on screen, so the next frame can wait for events
+        self.menuSurface = None
+        self.menuKey = None
+        self.menuBackground = None
+        self.messageSurface = None
+        self.messageText = None
+        self.overlayDrawn = False
+        self.renderedMode = None
+
+        # Profiler overlay, rendered again twice per second
+        self.profilerSurface = None
+        self.profilerRenderTime = 0
+
         # Loop properties
         self.clock = pygame.time.Clock()
 
-    def renderMenu(self):
-        window=self.window
-        darkSurface = pygame.Surface(window.get_size(),flags=pygame.SRCALPHA)
-        pygame.draw.rect(darkSurface, (0,0,0,150), darkSurface.get_rect())
-        window.blit(darkSurface, (0,0))
+    @property
+    def titleFont(self):
+        return AssetRegistry.getInstance().getFont("assets/BD_Cartoon_Shout.ttf", 72)
+
+    @property
+    def itemFont(self):
+        return AssetRegistry.getInstance().getFont("assets/BD_Cartoon_Shout.ttf", 48)
+
+    @property
+    def messageFont(self):
+        return AssetRegistry.getInstance().getFont("assets/BD_Cartoon_Shout.ttf", 36)
+
+    @property
+    def profilerFont(self):
+        return AssetRegistry.getInstance().getFont(None, 20)
+
+    @property
+    def menuCursor(self):
+        return AssetRegistry.getInstance().getImage("assets/cursor.png")
+
+    def menuItemSurface(self,item):
+        surface = item.get('surface')
+        if surface is None:
+            surface = self.itemFont.render(item['title'], True, (200, 0, 0))
+            self.menuWidth = max(self.gameState.menu.menuWidth, surface.get_width())
+            item['surface'] = surface
+        return surface
+
+    def composeMenu(self):
+        """
+        Returns the menu (title, items and cursor) on a transparent surface the size of the window
+        """
+        window = self.window
+        surface = pygame.Surface(window.get_size(),flags=pygame.SRCALPHA)
         # Initial y
         y = 50
         
         # Title
-        surface = self.titleFont.render("TANK BATTLEGROUNDS !!", True, (200, 0, 0))
-        x = (window.get_width() - surface.get_width()) // 2
-        window.blit(surface, (x, y))
-        y += (200 * surface.get_height()) // 100
+        title = self.titleFont.render("TANK BATTLEGROUNDS !!", True, (200, 0, 0))
+        x = (window.get_width() - title.get_width()) // 2
+        surface.blit(title, (x, y))
+        y += (200 * title.get_height()) // 100
         
         # Draw menu items
         menu = self.gameState.menu
         x = (window.get_width() - menu.menuWidth) // 2
         for index, item in enumerate(menu.menuItems):
             # Item text
-            surface = item['surface']
-            window.blit(surface, (x, y))
+            itemSurface = self.menuItemSurface(item)
+            surface.blit(itemSurface, (x, y))
             
             # Cursor
             if index == menu.currentMenuItem:
                 cursorX = x - self.menuCursor.get_width() - 10
-                cursorY = y + (surface.get_height() - self.menuCursor.get_height()) // 2
-                window.blit(self.menuCursor, (cursorX, cursorY))
+                cursorY = y + (itemSurface.get_height() - self.menuCursor.get_height()) // 2
+                surface.blit(self.menuCursor, (cursorX, cursorY))
             
-            y += (120 * surface.get_height()) // 100      
+            y += (120 * itemSurface.get_height()) // 100
+        return surface
+
+    def renderMenu(self):
+        """
+        Render the menu over the darkened game, and returns False if the window didn't change.
+        The darkened game is kept when the menu shows up, so a change only blits it and the menu.
+        """
+        window = self.window
+        menu = self.gameState.menu
+        key = (menu.currentMenuItem,tuple(item['title'] for item in menu.menuItems))
+        if self.menuBackground is None:
+            self.menuBackground = window.copy()
+            darkSurface = pygame.Surface(window.get_size(),flags=pygame.SRCALPHA)
+            darkSurface.fill((0,0,0,150))
+            self.menuBackground.blit(darkSurface, (0,0))
+        elif key == self.menuKey:
+            return False
+        if key != self.menuKey:
+            self.menuSurface = self.composeMenu()
+            self.menuKey = key
+        window.blit(self.menuBackground, (0,0))
+        window.blit(self.menuSurface, (0,0))
+        return True
 
     def renderMessage(self):
-        surface = self.messageFont.render(self.gameState.message, True, (200, 0, 0))
+        """
+        Render the message, and returns False if the window didn't change
+        """
+        message = self.gameState.message
+        if message != self.messageText:
+            self.messageSurface = self.messageFont.render(message, True, (200, 0, 0))
+            self.messageText = message
+        elif self.overlayDrawn:
+            return False
+        surface = self.messageSurface
         x = (self.window.get_width() - surface.get_width()) // 2
         y = (self.window.get_height() - surface.get_height()) // 2
         self.window.blit(surface, (x, y))
+        return True
 
     def renderLevel(self):
+        """
+        Render the level, and returns the list of rectangles to update, or None for the whole window
+        """
+        # The camera follows the player's unit, and the background is baked again when it moves
+        state = self.gameState
+        tank = state.level.units[0]
+        if state.camera.follow(state,state.interpolatedPosition(tank,self.interpolation)):
+            self.background = None
+        if self.dirtyRendering:
+            return self.renderLevelDirty()
+        # The static layers don't cover the parts of the window outside the world
+        self.window.fill((0,0,0))
+        for layer in self.layers:
+            self.renderLayer(layer,self.window)
+        return None
+
+    def renderLayer(self,layer,surface):
+        """
+        Render a layer, timed if there is a profiler
+        """
+        if self.profiler is None:
+            return layer.render(surface)
+        startTime = time.perf_counter()
+        rects = layer.render(surface)
+        # Layers of the same type are told apart by their image, e.g. layer.ArrayLayer(ground)
+        name = "layer.{}({})".format(type(layer).__name__,os.path.splitext(os.path.basename(layer.imageFile))[0])
+        self.profiler.add(name,time.perf_counter() - startTime)
+        return rects
+
+    def renderLevelDirty(self):
+        window = self.window
+        if self.background is None:
+            # Bake the static layers, and draw the whole window
+            self.background = pygame.Surface(window.get_size())
+            for layer in self.layers:
+                if layer.static:
+                    self.renderLayer(layer,self.background)
+            window.blit(self.background,(0,0))
+            updateRects = None
+        else:
+            # Restore the areas changed in the previous frame
+            for rect in self.dirtyRects:
+                window.blit(self.background,rect,rect)
+            updateRects = self.dirtyRects
+
+        rects = []
         for layer in self.layers:
-            layer.render(self.window)
+            if not layer.static:
+                rects.extend(self.renderLayer(layer,window))
+        if updateRects is not None:
+            updateRects = updateRects + rects
+        self.dirtyRects = rects
+        return updateRects
+
+    def renderProfiler(self):
+        """
+        Render the percentiles of the profiler timings, and returns the changed rectangle
+        """
+        now = time.perf_counter()
+        if self.profilerSurface is None or now - self.profilerRenderTime > 0.5:
+            self.profilerRenderTime = now
+            lines = [ "{:28s} {:>7s} {:>7s} {:>7s}".format("ms","p50","p95","p99") ]
+            for name,stats in sorted(self.profiler.report().items()):
+                lines.append("{:28s} {:7.2f} {:7.2f} {:7.2f}".format(name,stats['p50'],stats['p95'],stats['p99']))
+            surfaces = [ self.profilerFont.render(line, True, (255, 255, 255)) for line in lines ]
+            width = max(surface.get_width() for surface in surfaces) + 10
+            height = sum(surface.get_height() for surface in surfaces) + 10
+            self.profilerSurface = pygame.Surface((width,height),flags=pygame.SRCALPHA)
+            self.profilerSurface.fill((0,0,0,180))
+            y = 5
+            for surface in surfaces:
+                self.profilerSurface.blit(surface,(5,y))
+                y += surface.get_height()
+        return self.window.blit(self.profilerSurface,(0,0))
 
     def updateLayers(self):
         self.layers = [
@@ -91,22 +264,104 @@ class UserInterface():
             ArrayLayer(self.gameState.level.cellSize,"assets/walls.png",self.gameState,self.gameState.level.walls),
             UnitsLayer(self.gameState.level.cellSize,"assets/units.png",self.gameState,self.gameState.level.units),
             BulletsLayer(self.gameState.level.cellSize,"assets/explosions.png",self.gameState,self.gameState.bullets),
-            ExplosionsLayer(self.gameState.level.cellSize,"assets/explosions.png"),
+            ExplosionsLayer(self.gameState.level.cellSize,"assets/explosions.png",self.gameState),
         ]   
 
+    def updateStartupReport(self):
+        """
+        Complete the startup timings after the first frame and once all preloading is done, then print them
+        """
+        times = self.startupTimes
+        elapsed = time.perf_counter() - self.startupStartTime
+        if not any(name == "first frame at" for name,seconds in times):
+            times.append(("first frame at",elapsed))
+        assets = AssetRegistry.getInstance()
+        if not assets.isReady() or not self.controller.levelsReady():
+            return
+        times.append(("assets ready at",elapsed))
+        print("Startup: " + ", ".join("{} {:.1f} ms".format(name,1000 * seconds) for name,seconds in times))
+        loadTimes = list(assets.loadTimes.items()) + list(self.controller.levelLoadTimes.items())
+        for name,seconds in sorted(loadTimes,key=lambda item: -item[1]):
+            print("    {:40s} {:7.1f} ms".format(name,1000 * seconds))
+        self.startupTimes = None
+
+    def runTick(self):
+        """
+        Process the inputs and update the game state, timed if there is a profiler
+        """
+        controller = self.controller
+        profiler = self.profiler
+        if profiler is None:
+            controller.processInputLevel()
+            controller.update()
+        else:
+            startTime = time.perf_counter()
+            controller.processInputLevel()
+            inputTime = time.perf_counter()
+            controller.update()
+            profiler.add("frame.input",inputTime - startTime)
+            profiler.add("frame.update",time.perf_counter() - inputTime)
+
+    def updateLevel(self):
+        """
+        Run the game ticks for the time elapsed since the previous frame,
+        and set the interpolation of the layers for the time left
+        """
+        state = self.gameState
+        tickTime = 1 / self.tickRate
+        now = time.perf_counter()
+        if self.lastFrameTime is None:
+            # The first frame of a level runs one tick
+            self.accumulator = tickTime
+        else:
+            self.accumulator += now - self.lastFrameTime
+        self.lastFrameTime = now
+
+        ticks = 0
+        while self.accumulator >= tickTime and state.currentActiveMode == 'Play':
+            if ticks == self.maxTicksPerFrame:
+                # The game can't keep up: it slows down, rather than spending more and more time catching up
+                self.accumulator = 0
+                break
+            self.runTick()
+            self.accumulator -= tickTime
+            ticks += 1
+
+        self.interpolation = min(self.accumulator / tickTime,1.0)
+        for layer in self.layers:
+            layer.interpolation = self.interpolation
+
+    def overlayEvents(self):
+        """
+        Returns the pending events. Once the menu or the message is on screen, it only changes
+        with the inputs, so this waits for the next event instead of rendering identical frames.
+        """
+        if not self.overlayDrawn:
+            return pygame.event.get()
+        if self.startupTimes is not None:
+            # Wake up regularly, to complete the startup report when the preloading is done
+            event = pygame.event.wait(100)
+        else:
+            event = pygame.event.wait()
+        return [event] + pygame.event.get()
+
     def run(self):
         state = self.gameState
         controller = self.controller
         window=self.window
+        profiler = self.profiler
         while state.running:
+            # The whole window is updated, unless the level rendering returns the changed areas
+            updateRects = None
+            if profiler is not None:
+                frameStartTime = time.perf_counter()
+
             # Inputs and updates are exclusives
             if state.currentActiveMode == 'Overlay':
-                controller.processInputMenu()
+                controller.processInputMenu(self.overlayEvents())
             elif state.currentActiveMode == 'Play':
                 try:
-                    
-                    controller.processInputLevel()
-                    controller.update()
+                    self.updateLevel()
                 except Exception as ex:
                     print(ex)
                     darkSurface = pygame.Surface(window.get_size(),flags=pygame.SRCALPHA)
@@ -115,29 +370,66 @@ class UserInterface():
                     state.currentActiveMode = 'Overlay'
                     controller.showMessage("Error during the game update...")
             elif state.currentActiveMode == 'Message':
-                controller.processInputMessage()
+                controller.processInputMessage(self.overlayEvents())
             else:
                 break
 
             # Render game (if any), and then the overlay (if active)
+            if state.currentActiveMode != self.renderedMode:
+                self.renderedMode = state.currentActiveMode
+                self.menuBackground = None
+                self.overlayDrawn = False
+            windowChanged = True
             if state.currentActiveMode == 'Overlay':
-                self.renderMenu()
+                windowChanged = self.renderMenu()
             elif state.currentActiveMode == 'Play':
                 try:
-                    self.renderLevel()
+                    if profiler is None:
+                        updateRects = self.renderLevel()
+                    else:
+                        startTime = time.perf_counter()
+                        updateRects = self.renderLevel()
+                        profiler.add("frame.render",time.perf_counter() - startTime)
+                        if profiler.overlayVisible:
+                            rect = self.renderProfiler()
+                            if self.dirtyRendering:
+                                self.dirtyRects.append(rect)
+                            if updateRects is not None:
+                                updateRects.append(rect)
                 except Exception as ex:
                     print(ex)
                     state.currentActiveMode = 'Overlay'
                     self.renderMessage("Error during the game rendering...")
             elif state.currentActiveMode == 'Message':
-                self.renderMessage()
+                windowChanged = self.renderMessage()
             else:
                 break
+            self.overlayDrawn = state.currentActiveMode != 'Play' and state.currentActiveMode == self.renderedMode
             
             
                     
                 
-            # Update display
-            pygame.display.update()    
-            self.clock.tick(60)
+            # The background is baked again when the game comes back to the level,
+            # and the time spent out of the level is not simulated
+            if state.currentActiveMode != 'Play':
+                self.background = None
+                self.lastFrameTime = None
+
+            # Update display, unless nothing changed
+            if profiler is not None:
+                displayStartTime = time.perf_counter()
+            if not windowChanged:
+                pass
+            elif updateRects is None:
+                pygame.display.update()
+            else:
+                pygame.display.update(updateRects)
+            if profiler is not None:
+                now = time.perf_counter()
+                profiler.add("frame.display",now - displayStartTime)
+                profiler.add("frame.total",now - frameStartTime)
+                profiler.update()
+            if self.startupTimes is not None:
+                self.updateStartupReport()
+            self.clock.tick(self.frameRate)
     
\ No newline at end of file